@@ -0,0 +1,103 @@
+## Name: Eddie Wu
+## Description: Class for a grid index over the 8-bit Lab cube to speed up nearest-centroid lookups at large k
+
+import numpy as np
+
+
+class Centroid_Index:
+    ## Constructor
+    ## For every grid cell, only centroids that could be nearest to some pixel in the cell are kept as candidates:
+    ## a centroid is dropped if even its closest point in the cell is farther than another centroid's farthest point
+    # @param k_colors - representative pixels (list of tuples or k x 3 array)
+    # @param cell_size - int edge length of each grid cell in channel values
+    # centroids: k x 3 float array of centroids
+    # cells_per_axis: number of grid cells along each channel
+    # candidate_table: (cells x max candidates) array of centroid indices per cell, in ascending order, padded
+    #                  by repeating the first candidate
+    # candidate_counts: array of number of candidates per cell
+    # candidate_lists: list of candidate index lists per cell, for per-pixel lookups
+    def __init__(self, k_colors, cell_size=16):
+        self.centroids = np.asarray(k_colors, dtype=np.float64)
+        self.cell_size = cell_size
+        self.cells_per_axis = -(-256 // cell_size)
+
+        # Low and high (inclusive) corners of every cell, cells ordered by (channel 0, channel 1, channel 2)
+        axis_lows = np.arange(self.cells_per_axis) * cell_size
+        lows = np.stack(np.meshgrid(axis_lows, axis_lows, axis_lows, indexing='ij'), axis=-1).reshape(-1, 3)
+        highs = np.minimum(lows + cell_size - 1, 255)
+
+        num_cells, k = len(lows), len(self.centroids)
+        candidate_mask = np.empty((num_cells, k), dtype=bool)
+        # Process cells in blocks to bound the cells x k x 3 temporaries
+        block = max(1, (1 << 20) // max(k, 1))
+        for start in range(0, num_cells, block):
+            cell_lows = lows[start:start + block, np.newaxis, :]
+            cell_highs = highs[start:start + block, np.newaxis, :]
+            closest = np.clip(self.centroids[np.newaxis, :, :], cell_lows, cell_highs)
+            min_sq_dists = ((self.centroids - closest) ** 2).sum(axis=2)
+            farthest = np.maximum(np.abs(self.centroids - cell_lows), np.abs(self.centroids - cell_highs))
+            max_sq_dists = (farthest ** 2).sum(axis=2)
+            candidate_mask[start:start + block] = min_sq_dists <= max_sq_dists.min(axis=1)[:, np.newaxis]
+
+        self.candidate_counts = candidate_mask.sum(axis=1)
+        # Stable sort puts each cell's candidates first, in ascending index order so ties resolve like a linear scan
+        order = np.argsort(~candidate_mask, axis=1, kind='stable')[:, :self.candidate_counts.max()]
+        padding = np.arange(order.shape[1])[np.newaxis, :] >= self.candidate_counts[:, np.newaxis]
+        self.candidate_table = np.where(padding, order[:, :1], order)
+        self.candidate_lists = [row[:count].tolist() for row, count in
+                                zip(self.candidate_table, self.candidate_counts.tolist())]
+        self.centroid_list = [tuple(centroid) for centroid in self.centroids.tolist()]
+
+    ## Returns the grid cell of each pixel
+    # @param pixels - N x 3 array of 8-bit pixel values
+    # @return array of N cell indices
+    #
+    def get_cells(self, pixels):
+        coords = np.asarray(pixels, dtype=np.intp) // self.cell_size
+        return (coords[:, 0] * self.cells_per_axis + coords[:, 1]) * self.cells_per_axis + coords[:, 2]
+
+    ## Finds the closest centroid to a single pixel
+    # @param pixel - tuple of three ints
+    # @return tuple of (index of closest centroid, squared distance to it)
+    #
+    def nearest(self, pixel):
+        cell = ((pixel[0] // self.cell_size * self.cells_per_axis + pixel[1] // self.cell_size) * self.cells_per_axis
+                + pixel[2] // self.cell_size)
+        idx_of_closest = -1
+        min_distance = float("inf")
+        for i in self.candidate_lists[cell]:
+            centroid = self.centroid_list[i]
+            distance = ((pixel[0] - centroid[0]) ** 2 + (pixel[1] - centroid[1]) ** 2
+                        + (pixel[2] - centroid[2]) ** 2)
+            if distance < min_distance:
+                min_distance = distance
+                idx_of_closest = i
+        return idx_of_closest, min_distance
+
+    ## Finds the closest centroid to every pixel, comparing each pixel only against its cell's candidates
+    # @param pixels - N x 3 array of 8-bit pixel values
+    # @param labels - optional array of N cluster indices to write into
+    # @param chunk_size - number of pixels to process at a time
+    # @return tuple of (array of N cluster indices, array of N squared distances to the closest centroid)
+    #
+    def query(self, pixels, labels=None, chunk_size=65536):
+        num_pixels = len(pixels)
+        if labels is None:
+            labels = np.empty(num_pixels, dtype=np.intp)
+        sq_dists = np.empty(num_pixels)
+        for start in range(0, num_pixels, chunk_size):
+            chunk = pixels[start:start + chunk_size]
+            cells = self.get_cells(chunk)
+            # Group pixels by their cell's candidate count rounded up to a power of two, so each group only
+            # compares against about as many centroids as its cells need
+            count_buckets = np.ceil(np.log2(self.candidate_counts[cells])).astype(np.intp)
+            for bucket in np.unique(count_buckets).tolist():
+                in_bucket = np.flatnonzero(count_buckets == bucket)
+                candidates = self.candidate_table[cells[in_bucket], :1 << bucket]
+                diffs = chunk[in_bucket, np.newaxis, :].astype(np.float64) - self.centroids[candidates]
+                bucket_sq_dists = np.einsum('ijk,ijk->ij', diffs, diffs)
+                closest = np.argmin(bucket_sq_dists, axis=1)
+                rows = np.arange(len(in_bucket))
+                labels[start + in_bucket] = candidates[rows, closest]
+                sq_dists[start + in_bucket] = bucket_sq_dists[rows, closest]
+        return labels, sq_dists
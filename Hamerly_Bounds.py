@@ -0,0 +1,89 @@
+## Name: Eddie Wu
+## Description: Class for triangle-inequality accelerated (Hamerly) assignment of pixels to centroids
+
+import numpy as np
+import k_means_utils
+
+
+class Hamerly_Bounds:
+    ## Constructor
+    # @param pixels - N x 3 array of pixel values that will be assigned on every iteration
+    # @param chunk_size - number of pixels to process at a time when computing all k distances
+    # upper: array of N upper bounds on the distance from each pixel to its assigned centroid
+    # lower: array of N lower bounds on the distance from each pixel to its second closest centroid
+    # bound_centroids: k x 3 array of the centroids the bounds were computed against
+    def __init__(self, pixels, chunk_size=k_means_utils.DISTANCE_CHUNK_SIZE):
+        self.pixels = pixels
+        self.chunk_size = chunk_size
+        self.upper = None
+        self.lower = None
+        self.bound_centroids = None
+
+    ## Labels each pixel with its closest centroid, skipping pixels whose bounds prove the label cannot change
+    ## NB the first call (or a call with a different k) computes every distance to set up the bounds
+    # @param k_colors - current representative pixels (list of tuples, length k)
+    # @param labels - array of N cluster indices, updated in place
+    # @return number of pixel-to-centroid distance evaluations that were skipped (int)
+    #
+    def assign(self, k_colors, labels):
+        centroids = np.asarray(k_colors, dtype=np.float64)
+        k = len(centroids)
+        num_pixels = len(self.pixels)
+
+        if self.bound_centroids is None or len(self.bound_centroids) != k:
+            self.upper = np.empty(num_pixels)
+            self.lower = np.empty(num_pixels)
+            self.update_bounds(np.arange(num_pixels), centroids, labels)
+            self.bound_centroids = centroids
+            return 0
+
+        # Loosen the bounds by how far each centroid moved since the bounds were computed
+        drift = np.sqrt(((centroids - self.bound_centroids) ** 2).sum(axis=1))
+        self.upper += drift[labels]
+        if k > 1:
+            # The second closest centroid can be any other centroid, so use the largest drift among the others
+            max_drift_idx = int(np.argmax(drift))
+            max_drift, second_max_drift = np.sort(drift)[::-1][:2]
+            self.lower -= np.where(labels == max_drift_idx, second_max_drift, max_drift)
+        self.bound_centroids = centroids
+
+        # Half the distance from each centroid to its nearest other centroid
+        centroid_dists = np.sqrt(k_means_utils.get_sq_dists_np(centroids, centroids))
+        np.fill_diagonal(centroid_dists, np.inf)
+        half_min_centroid_dists = centroid_dists.min(axis=1) / 2
+
+        # A pixel keeps its label if its upper bound is within either bound, otherwise tighten and test again
+        bounds = np.maximum(half_min_centroid_dists[labels], self.lower)
+        candidates = np.flatnonzero(self.upper > bounds)
+        for start in range(0, len(candidates), self.chunk_size):
+            chunk_idx = candidates[start:start + self.chunk_size]
+            diffs = self.pixels[chunk_idx].astype(np.float64) - centroids[labels[chunk_idx]]
+            self.upper[chunk_idx] = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        to_update = candidates[self.upper[candidates] > bounds[candidates]]
+        self.update_bounds(to_update, centroids, labels)
+
+        # Tightened pixels cost one distance, fully updated pixels cost k
+        num_evaluated = len(candidates) + len(to_update) * k
+        return num_pixels * k - num_evaluated
+
+    ## Discards the bounds, e.g. after labels were changed outside assign, so the next call recomputes every distance
+    #
+    def reset(self):
+        self.bound_centroids = None
+
+    ## Computes every distance for the given pixels and resets their labels and bounds
+    # @param pixel_idx - array of indices of the pixels to update
+    # @param centroids - k x 3 array of centroids
+    # @param labels - array of N cluster indices, updated in place
+    #
+    def update_bounds(self, pixel_idx, centroids, labels):
+        for start in range(0, len(pixel_idx), self.chunk_size):
+            chunk_idx = pixel_idx[start:start + self.chunk_size]
+            sq_dists = k_means_utils.get_sq_dists_np(self.pixels[chunk_idx], centroids)
+            closest = np.argmin(sq_dists, axis=1)
+            labels[chunk_idx] = closest
+            self.upper[chunk_idx] = np.sqrt(sq_dists[np.arange(len(chunk_idx)), closest])
+            if len(centroids) > 1:
+                self.lower[chunk_idx] = np.sqrt(np.partition(sq_dists, 1, axis=1)[:, 1])
+            else:
+                self.lower[chunk_idx] = np.inf
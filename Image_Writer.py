@@ -0,0 +1,81 @@
+## Name: Eddie Wu
+## Description: Class for encoding and saving result files on background threads, so clustering is not held up by
+##              image encoding and disk writes
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+
+
+## Saves an image, then closes it to free its memory
+# @param img - PIL image
+# @param path - path to save the image to, format taken from the extension
+#
+def save_and_close_image(img, path):
+    try:
+        img.save(path)
+    finally:
+        img.close()
+
+
+class Image_Writer:
+    ## Constructor
+    # @param num_threads - number of writer threads; 0 writes each file immediately on the calling thread
+    # @param max_pending - maximum number of writes queued or in progress (each may hold an image in memory);
+    #                      submitting another blocks until one finishes, defaults to twice the number of threads
+    # executor: ThreadPoolExecutor running the writes, None if writing on the calling thread
+    # pending_slots: semaphore bounding the number of writes queued or in progress
+    # writes: list of (path, Future) tuples of writes not yet waited on
+    def __init__(self, num_threads=2, max_pending=None):
+        self.executor = ThreadPoolExecutor(num_threads, thread_name_prefix='image_writer') if num_threads > 0 else None
+        self.pending_slots = threading.BoundedSemaphore(max_pending or max(2 * num_threads, 1))
+        self.writes = []
+
+    ## Enter method for context manager
+    def __enter__(self):
+        return self
+
+    ## Queues a write, blocking first if max_pending writes are already queued or in progress
+    # @param path - path of the file being written, for reporting failures
+    # @param write_function - function that writes the file
+    # @param args - arguments for write_function
+    def submit(self, path, write_function, *args):
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(write_function(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            self.pending_slots.acquire()
+            try:
+                future = self.executor.submit(write_function, *args)
+            except BaseException:
+                self.pending_slots.release()
+                raise
+            future.add_done_callback(lambda _: self.pending_slots.release())
+        self.writes.append((path, future))
+
+    ## Queues an image to be saved and then closed; the caller must not use the image afterwards
+    # @param img - PIL image
+    # @param path - path to save the image to
+    def save_image(self, img, path):
+        self.submit(path, save_and_close_image, img, path)
+
+    ## Waits for every queued write to finish and logs the ones that failed
+    # @param logger - instance of logger
+    # @return number of failed writes
+    def wait(self, logger):
+        writes, self.writes = self.writes, []
+        num_failed = 0
+        for path, future in writes:
+            exception = future.exception()
+            if exception is not None:
+                num_failed += 1
+                logger.log(f"Failed to save {path}: {exception!r}")
+        return num_failed
+
+    ## Exit method for context manager: finishes outstanding writes and stops the threads
+    def __exit__(self, exception_type, exception_object, exception_traceback):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -2,13 +2,22 @@
 ## Description: Class for k-means process
 
 
-from PIL import Image, ImageCms, ImageOps
+from PIL import Image
 from Logger import Logger
+import random
 from time import perf_counter
 from matplotlib import pyplot as plt
-from random import choices
+import numpy as np
+import color_utils
 import k_means_utils
+import lab_cache_utils
 import palette_utils
+import parallel_utils
+import quantizer_utils
+import tile_utils
+from Hamerly_Bounds import Hamerly_Bounds
+from Image_Writer import Image_Writer
+from Palette_Result import Palette_Result
 
 
 class K_Means:
@@ -21,13 +30,81 @@ class K_Means:
     # @param img_extension - string for the extension of the original image
     # @param palette_replace - bool for whether to create copies of original with colors replaced by palette colors
     # @param do_resize - int for % to resize down to; default is 100
-    # src_pixels: list of coords & RGB tuples ((x, y), (r, g, b)) for the source image
+    # @param engine - 'numpy' for the vectorized clustering engine, 'python' for the original pure Python loops
+    # @param use_histogram - bool for whether to cluster the image's unique colors weighted by count (numpy engine only)
+    # @param assignment - 'exhaustive' to compute all k distances per pixel, 'hamerly' to skip distances using
+    #                     triangle-inequality bounds (numpy engine only)
+    # @param fit_mode - 'lloyd' to iterate over every pixel until convergence, 'minibatch' to update centroids from
+    #                   random batches of pixels for a fixed number of iterations (numpy engine only)
+    # @param minibatch_size - int number of pixels per batch in minibatch mode
+    # @param minibatch_iterations - int number of batches to run in minibatch mode
+    # @param seeding - 'k-means++' for k-means++ seeding, 'k-means||' for scalable k-means|| seeding, which
+    #                  oversamples candidates over a few passes and reclusters them, or the name of a quantizer
+    #                  in quantizer_utils.QUANTIZERS to start from its palette (numpy engine only)
+    # @param warm_start - None to seed every k from scratch; for ranged k, 'split' or 'k-means++' to seed each k
+    #                     from the previous k's converged k_colors in the same run, adding centroids by splitting
+    #                     the highest-SSE clusters or by k-means++ picks from the residual (numpy engine only)
+    # @param num_workers - int number of processes to spread independent (run, k) jobs across; default is 1
+    # @param max_shift - float, Lloyd iterations stop once no centroid moves more than this distance
+    # @param sse_tolerance - optional float, Lloyd iterations stop once SSE improves by less than this fraction
+    #                        (costs one extra SSE pass per iteration)
+    # @param max_iterations - optional int hard cap on Lloyd iterations per run
+    # @param coreset_size - optional int, fit on an importance-weighted sample of about this many points, then label
+    #                       every pixel in one full-resolution pass (numpy engine only)
+    # @param pyramid_levels - int number of resolution levels; above 1, each run converges on a copy of the image
+    #                         downscaled by 2 per level and refines level by level up to full size (numpy engine
+    #                         and Lloyd fitting only); default is 1
+    # @param refine_iterations - int cap on Lloyd iterations at each level above the coarsest in pyramid mode
+    # @param algorithm - 'k-means', or the name of a histogram-based quantizer in quantizer_utils.QUANTIZERS
+    #                    ('median cut', 'octree', 'wu') to find the palette in one pass instead (numpy engine only)
+    # @param seed - optional int base seed; each (run, k) draws from its own stream derived from it, so any run can be
+    #              replayed exactly, serially or in parallel; a random seed is chosen (and logged) if None
+    # @param render_best - optional int, keep only palettes, labels and SSE in memory during the runs and render
+    #                      result images for just the render_best lowest-SSE runs per k once all runs finish
+    #                      (0 renders none, for clients that only need the palette data); None renders every run
+    #                      as it finishes
+    # @param num_writers - int number of background threads encoding and saving result files, so clustering carries
+    #                      on meanwhile; 0 saves each file before moving on
+    # @param tile_size - optional int, process the image out of core in tiles of about this many pixels (whole
+    #                    rows): it is kept as Lab in a memory-mapped file, each Lloyd iteration accumulates cluster
+    #                    counts and sums tile by tile, and result images are written tile by tile as PNGs
+    # @param lab_cache_dir - optional directory to cache the image's decoded, resized Lab pixels in (e.g.
+    #                        lab_cache_utils.LAB_CACHE_DIR), keyed by the file's contents, mtime and resize_level;
+    #                        later runs on the same image map them from disk instead of decoding it again
+    # @param empty_cluster_reseed - 'farthest' to re-seed an empty cluster with the pixel farthest from its centroid,
+    #                               'split' to re-seed it with half of the highest-SSE cluster
+    # src_pixels: N x 3 uint8 array of Lab values for the source image, pixel (x, y) is at index y * width + x
+    #             (memory-mapped from a temporary file in tiled mode, or from the Lab cache)
+    # fit_pixels: array of points k-means runs on, either src_pixels or the unique colors of src_pixels
+    # fit_weights: array of weights (pixel counts) for fit_pixels, or None if every point counts once
+    # fit_labels: array of cluster indices for fit_pixels
+    # assign_pixels: array of points labelled for SSE and result images, fit_pixels unless fitting on a coreset
+    # assign_weights: array of weights for assign_pixels, or None if every point counts once
+    # assign_labels: array of cluster indices for assign_pixels
+    # pyramid_pixels: concatenated downscaled pixel arrays of the pyramid levels below full size, coarsest first
+    # pyramid_sizes: list of number of pixels in each level of pyramid_pixels
+    # unique_keys: sorted packed keys of the unique colors, used to expand fit_labels back to pixels
     # k_colors: list of RGB tuples
-    # k_clusters: list of lists, each list contains a tuple of coords and RGB values ((x, y), (r, g, b))
-    # SSE: dict mapping k value to list of longs, each list logs SSE of each run at that k value
+    # labels: array of N cluster indices, ith label is the index in k_colors of the ith pixel's cluster
+    # SSE: dict mapping k value to list of floats, each list logs SSE of each run at that k value
+    # best_results: dict mapping k value to the Palette_Result of its lowest-SSE run, None if every run failed
+    # best_runs: dict mapping k value to list of Palette_Results of the lowest-SSE runs still to be rendered, in
+    #            ascending SSE order (only with render_best)
+    # num_reseeds: number of empty clusters re-seeded in the current run
     # total_time: total time elapsed in seconds for suite of runs
     # result_img_path: path to result image for server response
-    def __init__(self, project_name, k_values, file_path, num_runs, log_file_name, img_extension, palette_replace, resize_level):
+    # image_writer: Image_Writer saving result files while running, None otherwise
+    # cluster_sizes: array of cluster sizes of the current result, for rendering tiled results without labels
+    # rng: numpy.random.Generator of the current (run, k), every random draw of the run comes from it
+    # last_k: k value whose best result run() returns; only its results keep their label map, unless rendering the
+    #         best runs is deferred, so labels are not held (or sent back by workers) for every run and k
+    def __init__(self, project_name, k_values, file_path, num_runs, log_file_name, img_extension, palette_replace,
+                 resize_level, engine='numpy', use_histogram=False, assignment='exhaustive',
+                 fit_mode='lloyd', minibatch_size=1024, minibatch_iterations=100, seeding='k-means++',
+                 warm_start=None, num_workers=1, max_shift=1.0, sse_tolerance=None, max_iterations=300,
+                 coreset_size=None, pyramid_levels=1, refine_iterations=3,
+                 empty_cluster_reseed='farthest', algorithm='k-means', seed=None,
+                 render_best=None, num_writers=2, tile_size=None, lab_cache_dir=None):
         self.project_name = project_name
         self.file_path = file_path
         self.k_values = k_values
@@ -36,88 +113,360 @@ class K_Means:
         self.img_extension = img_extension
         self.palette_replace = palette_replace
         self.resize_level = resize_level
-
-        self.src_pixels_with_coords = []
+        if engine not in ('numpy', 'python'):
+            raise ValueError(f"Unknown k-means engine: {engine}")
+        self.engine = engine
+        if use_histogram and engine != 'numpy':
+            raise ValueError("Histogram clustering requires the numpy engine")
+        self.use_histogram = use_histogram
+        if assignment not in ('exhaustive', 'hamerly'):
+            raise ValueError(f"Unknown assignment mode: {assignment}")
+        if assignment == 'hamerly' and engine != 'numpy':
+            raise ValueError("Hamerly assignment requires the numpy engine")
+        self.assignment = assignment
+        if fit_mode not in ('lloyd', 'minibatch'):
+            raise ValueError(f"Unknown fit mode: {fit_mode}")
+        if fit_mode == 'minibatch' and engine != 'numpy':
+            raise ValueError("Minibatch fitting requires the numpy engine")
+        self.fit_mode = fit_mode
+        self.minibatch_size = minibatch_size
+        self.minibatch_iterations = minibatch_iterations
+        if seeding not in ('k-means++', 'k-means||') and seeding not in quantizer_utils.QUANTIZERS:
+            raise ValueError(f"Unknown seeding method: {seeding}")
+        if seeding != 'k-means++' and engine != 'numpy':
+            raise ValueError(f"{seeding} seeding requires the numpy engine")
+        self.seeding = seeding
+        if warm_start not in (None, 'split', 'k-means++'):
+            raise ValueError(f"Unknown warm start method: {warm_start}")
+        if warm_start is not None and engine != 'numpy':
+            raise ValueError("Warm starting requires the numpy engine")
+        self.warm_start = warm_start
+        self.num_workers = num_workers
+        self.max_shift = max_shift
+        self.sse_tolerance = sse_tolerance
+        self.max_iterations = max_iterations
+        if coreset_size is not None and engine != 'numpy':
+            raise ValueError("Coreset fitting requires the numpy engine")
+        if coreset_size is not None and coreset_size < 1:
+            raise ValueError(f"Coreset size must be positive: {coreset_size}")
+        self.coreset_size = coreset_size
+        if pyramid_levels > 1 and (engine != 'numpy' or fit_mode != 'lloyd'):
+            raise ValueError("Pyramid fitting requires the numpy engine and Lloyd fitting")
+        self.pyramid_levels = pyramid_levels
+        self.refine_iterations = refine_iterations
+        if empty_cluster_reseed not in ('farthest', 'split'):
+            raise ValueError(f"Unknown empty cluster re-seeding method: {empty_cluster_reseed}")
+        self.empty_cluster_reseed = empty_cluster_reseed
+        if algorithm != 'k-means' and algorithm not in quantizer_utils.QUANTIZERS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+        if algorithm != 'k-means' and (engine != 'numpy' or fit_mode != 'lloyd' or warm_start is not None
+                                       or pyramid_levels > 1):
+            raise ValueError(f"The {algorithm} quantizer requires the numpy engine and no minibatch, warm start or "
+                             f"pyramid options")
+        self.algorithm = algorithm
+        if seed is not None and not 0 <= seed < k_means_utils.MAX_SEED:
+            raise ValueError(f"Seed must be between 0 and {k_means_utils.MAX_SEED - 1}: {seed}")
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        if render_best is not None and render_best < 0:
+            raise ValueError(f"Number of runs to render must not be negative: {render_best}")
+        self.render_best = render_best
+        self.num_writers = num_writers
+        if tile_size is not None and tile_size < 1:
+            raise ValueError(f"Tile size must be positive: {tile_size}")
+        if tile_size is not None and (engine != 'numpy' or use_histogram or assignment != 'exhaustive'
+                                      or fit_mode != 'lloyd' or warm_start is not None or num_workers > 1
+                                      or coreset_size is not None or pyramid_levels > 1 or algorithm != 'k-means'
+                                      or empty_cluster_reseed != 'farthest'):
+            raise ValueError("Tiled processing requires the numpy engine, exhaustive Lloyd iterations of k-means "
+                             "with farthest re-seeding, and no histogram, warm start, parallel, coreset or pyramid "
+                             "options")
+        self.tile_size = tile_size
+        self.lab_cache_dir = lab_cache_dir
+
+        self.src_pixels = None
+        self.fit_pixels = None
+        self.fit_weights = None
+        self.fit_labels = None
+        self.assign_pixels = None
+        self.assign_weights = None
+        self.assign_labels = None
+        self.pyramid_pixels = None
+        self.pyramid_sizes = []
+        self.unique_keys = None
         self.k_colors = []
-        self.k_clusters = [[]]
+        self.labels = None
         self.SSE = {}
+        self.best_results = {}
+        self.best_runs = {}
+        self.num_reseeds = 0
         self.total_time = 0
         self.result_img_path = ''
+        self.image_writer = None
+        self.cluster_sizes = None
+        self.last_k = None
+        self.rng = None
 
     ## Main function to run k-means
+    # @return Palette_Result of the lowest-SSE run of the last k value, None if every run at that k failed
     def run(self):
         print('\nPlease wait... running k-means clustering.')
 
-        with Image.open(self.file_path) as img, Logger(self.log_file_name) as logger:
-            img = ImageOps.exif_transpose(img)
+        with Logger(self.log_file_name) as logger, Image_Writer(self.num_writers) as self.image_writer:
             logger.log('Project Name: ' + self.project_name + '\n\n')
+            logger.log(f"Seed: {self.seed}\n")
 
-            if self.resize_level < 100:
-                resize_fraction = self.resize_level / 100
-                img = img.resize((round(img.width * resize_fraction), round(img.height * resize_fraction)))
-
-            # Convert to lab space
-            srgb_p = ImageCms.createProfile("sRGB")
-            lab_p = ImageCms.createProfile("LAB")
-            rgb2lab = ImageCms.buildTransformFromOpenProfiles(srgb_p, lab_p, "RGB", "LAB")
-            lab_img = ImageCms.applyTransform(img, rgb2lab)
-
-            # Load image array
-            # src_image_array = img.load()
-            src_image_array = lab_img.load()
-            img_height, img_width = lab_img.height, lab_img.width
-            # Obtain list of pixels as RGB tuples
-            for x in range(img_width):
-                for y in range(img_height):
-                    self.src_pixels_with_coords.append(((x, y), (src_image_array[x, y])))
+            lab_img, img_width, img_height = self.load_source_pixels(logger)
+            # Images made from the pixels are in LAB mode
+            img_mode = "LAB"
 
             print(f"Number of pixels in image: {img_height * img_width}\n")
             logger.log(f"Number of pixels in image: {img_height * img_width}\n")
 
+            if self.pyramid_levels > 1:
+                # Downscaled copies are only used to find starting centroids, so they are built once for every run
+                levels = k_means_utils.get_pyramid_levels(self.src_pixels, img_width, img_height,
+                                                          self.pyramid_levels)
+                self.pyramid_pixels = np.concatenate(levels)
+                self.pyramid_sizes = [len(level) for level in levels]
+                logger.log(f"Number of pixels in pyramid levels: {self.pyramid_sizes}\n")
+
+            if self.use_histogram:
+                # Collapse the image into its unique colors, each weighted by how many pixels share it
+                self.unique_keys, self.fit_pixels, self.fit_weights = k_means_utils.get_unique_colors(self.src_pixels)
+                print(f"Number of unique colors in image: {len(self.fit_pixels)}\n")
+                logger.log(f"Number of unique colors in image: {len(self.fit_pixels)}\n")
+            else:
+                self.fit_pixels = self.src_pixels
+            self.assign_pixels, self.assign_weights = self.fit_pixels, self.fit_weights
+
+            if self.coreset_size is not None and self.coreset_size < len(self.fit_pixels):
+                # Fit on a weighted sample, the full set of points is only labelled once per run
+                self.fit_pixels, self.fit_weights = k_means_utils.get_lightweight_coreset(
+                    self.assign_pixels, self.coreset_size, self.assign_weights, k_means_utils.get_rng(self.seed))
+                print(f"Number of points in coreset: {len(self.fit_pixels)}\n")
+                logger.log(f"Number of points in coreset: {len(self.fit_pixels)}\n")
+
             # Loop to run n times for specified values of k (single or ranged)
             k_start, k_end, k_interval = self.k_values
+            k_list = list(range(k_start, k_end + 1, k_interval))
+            self.last_k = k_list[-1]
             # Initialize elements in SSE dict to empty lists
-            for k in range(k_start, k_end + 1, k_interval):
+            for k in k_list:
                 self.SSE[k] = []
-            for run_num in range(self.num_runs):
-                logger.log(f"{'~' * 6} Run #{run_num + 1} of {self.num_runs} {'~' * 6}\n")
-                for k in range(k_start, k_end + 1, k_interval):
-                    logger.log("k = " + str(k))
-                    # Initialize k_clusters based on current k value
-                    self.k_clusters = [[] for _ in range(k)]
-                    try:
-                        # Run k-means algorithm
-                        self.run_k_means(src_image_array, img_height, img_width, k, logger)
-                        # Create result visualization
-                        self.result_img_path = self.visualize_results(src_image_array, img.mode, img_width, img_height, run_num, k)
-                        # Calculate and log total SSE for the given k
-                        sse_value = k_means_utils.get_total_SSE(self.k_colors, self.k_clusters)
-                        self.SSE[k].append(sse_value)
-                        logger.log(f"SSE: {sse_value} (k = {k})")
-                        logger.log(f"\n{'~' * 18}\n")
-                    except Exception as e:
-                        print('Quitting current run due to error: ' + str(e))
-                        logger.log('Quitting current run due to error: ' + str(e))
-                    finally:
-                        # Clean up to reset k_colors for next run
-                        self.k_colors = []
+                self.best_results[k] = None
+                self.best_runs[k] = []
+            # Split the work into independent jobs; warm-started k values depend on the previous k in their run,
+            ## so each run stays together as one job
+            if self.warm_start is not None:
+                jobs = [(run_num, k_list) for run_num in range(self.num_runs)]
+            else:
+                jobs = [(run_num, [k]) for run_num in range(self.num_runs) for k in k_list]
+
+            if self.num_workers > 1:
+                # Run jobs across processes and record their results as they finish, so only the best results are
+                ## kept; job logs are small and wait until every earlier job has been logged
+                pending_logs = {}
+                next_job_idx = 0
+                for job_idx, (log_lines, results, time_elapsed) in parallel_utils.run_jobs(
+                        self, jobs, img_mode, img_width, img_height, self.num_workers):
+                    self.record_job_results(results)
+                    self.total_time += time_elapsed
+                    pending_logs[job_idx] = log_lines
+                    while next_job_idx in pending_logs:
+                        run_num, job_k_list = jobs[next_job_idx]
+                        if job_k_list[0] == k_start:
+                            logger.log(f"{'~' * 6} Run #{run_num + 1} of {self.num_runs} {'~' * 6}\n")
+                        for line in pending_logs.pop(next_job_idx):
+                            logger.log(line)
+                        next_job_idx += 1
+            else:
+                for run_num, job_k_list in jobs:
+                    if job_k_list[0] == k_start:
+                        logger.log(f"{'~' * 6} Run #{run_num + 1} of {self.num_runs} {'~' * 6}\n")
+                    results = self.run_job(run_num, job_k_list, lab_img, img_mode, img_width, img_height,
+                                           logger)
+                    self.record_job_results(results)
+
+            if self.render_best is not None:
+                self.render_best_runs(lab_img, img_mode, img_width, img_height, logger)
+            # Result files must all be on disk before they are reported
+            self.image_writer.wait(logger)
 
             # Perform any necessary cleanup / analysis / plotting
             # Plot total SSE against k if used a range of k values
             if k_start != k_end:
                 self.plot_SSE()
 
-            total_pixels = 0
-            for cluster in self.k_clusters:
-                total_pixels += len(cluster)
-            print(f"Number of pixels processed: {total_pixels}\n")
+            print(f"Number of pixels processed: {len(self.src_pixels)}\n")
 
             # Log total time elapsed for this suite of runs
             logger.log(f"Summary: \nNumber of runs: {self.num_runs}\n"
                        f"k_start: {k_start}; k_end: {k_end}; k_interval: {k_interval}\n"
                        f"Total time elapsed: {self.total_time} seconds.")
 
-        return self.result_img_path
+        self.image_writer = None
+        # Report the best run of the last k
+        return self.best_results[k_list[-1]]
+
+    ## Decodes, resizes and converts the source image to Lab into src_pixels, or maps them from the Lab cache
+    # @param logger - Logger of the process
+    # @return tuple of (PIL image in Lab or None in tiled mode, image width, image height)
+    #
+    def load_source_pixels(self, logger):
+        cache_path = None
+        if self.lab_cache_dir is not None:
+            cache_path = lab_cache_utils.get_lab_cache_path(self.file_path, self.resize_level, self.lab_cache_dir)
+            cached_pixels = lab_cache_utils.load_lab_pixels(cache_path)
+            if cached_pixels is not None:
+                self.src_pixels, img_width, img_height = cached_pixels
+                logger.log(f"Loaded Lab pixels from {cache_path}\n")
+                # Tiled mode only reads the mapped pixels, otherwise result images are drawn on the Lab image
+                if self.tile_size is not None:
+                    return None, img_width, img_height
+                return palette_utils.create_lab_image(self.src_pixels, img_width, img_height), img_width, img_height
+
+        with Image.open(self.file_path) as img:
+            if self.tile_size is None:
+                # Decode at reduced scale where possible rather than decoding the full image and then resizing it
+                img = palette_utils.get_resized_image(img, self.resize_level)
+
+                # Convert to lab space
+                lab_img = color_utils.rgb_to_lab_image(img)
+
+                img_height, img_width = lab_img.height, lab_img.width
+                # Obtain compact N x 3 array of pixels, coordinates are implied by index
+                self.src_pixels = k_means_utils.get_lab_pixel_array(lab_img)
+            else:
+                if self.resize_level < 100:
+                    img = palette_utils.get_resized_image(img, self.resize_level)
+                # Convert to lab space tile by tile into a memory-mapped file, the image is never held as a whole
+                ## in Lab and only tiles are read from here on
+                lab_img = None
+                self.src_pixels, img_width, img_height = tile_utils.create_lab_tiles(img, self.tile_size)
+
+        if cache_path is not None:
+            # Both modes convert the same way, so either can use the other's cached pixels
+            lab_cache_utils.save_lab_pixels(cache_path, self.src_pixels, img_width, img_height)
+            logger.log(f"Cached Lab pixels in {cache_path}\n")
+        return lab_img, img_width, img_height
+
+    ## Runs k-means for a list of k values within one run, creating result images and calculating SSE for each
+    # @param run_num - number of the current run
+    # @param k_list - list of k values to run, in order
+    # @param src_img - PIL image of source image in Lab
+    # @param mode - mode of the image used for result images
+    # @param img_width - width of image
+    # @param img_height - height of image
+    # @param logger - instance of logger
+    # @return list of (k, Palette_Result or None if the run failed) tuples
+    def run_job(self, run_num, k_list, src_img, mode, img_width, img_height, logger):
+        results = []
+        # Converged k_colors and labels of the previous k in this run, used to warm start the next k
+        warm_k_colors, warm_labels = None, None
+        for k in k_list:
+            logger.log("k = " + str(k))
+            # Every (run, k) gets its own random stream, so results do not depend on what ran before it, where, or
+            ## on other K_Means processes drawing at the same time
+            self.rng = k_means_utils.get_rng(self.seed, run_num, k)
+            # Initialize labels based on current k value; tiled runs never hold labels for every pixel
+            self.fit_labels, self.assign_labels = None, None
+            if self.tile_size is None:
+                self.fit_labels = np.zeros(len(self.fit_pixels), dtype=k_means_utils.get_label_dtype(k))
+                self.assign_labels = self.fit_labels
+                if self.assign_pixels is not self.fit_pixels:
+                    self.assign_labels = np.zeros(len(self.assign_pixels), dtype=self.fit_labels.dtype)
+            # Pixel labels are the assigned labels unless they need expanding from unique colors
+            self.labels = None if self.use_histogram else self.assign_labels
+            try:
+                if self.tile_size is not None:
+                    # Cluster sizes and SSE come from a last pass over the tiles with the final centroids
+                    self.cluster_sizes, sse_value = self.run_tiled_k_means(k, logger)
+                else:
+                    initial_k_colors = None
+                    if warm_k_colors is not None:
+                        initial_k_colors = self.get_warm_start_colors(warm_k_colors, warm_labels, k)
+                    # Run k-means algorithm, or a quantizer in its place
+                    if self.algorithm == 'k-means':
+                        self.run_k_means(src_img.load(), img_height, img_width, k, logger, initial_k_colors)
+                    else:
+                        self.run_quantizer(k, logger)
+                    if self.assign_pixels is not self.fit_pixels:
+                        self.run_full_assignment(logger)
+                    # Calculate and log total SSE for the given k
+                    sse_value = k_means_utils.get_total_SSE(self.k_colors, self.assign_pixels, self.assign_labels,
+                                                            self.assign_weights)
+                    self.cluster_sizes = np.bincount(self.assign_labels, weights=self.assign_weights, minlength=k)
+                # Keep the label map only where it may still be needed: to render this run later, or to return it
+                keep_labels = k == self.last_k or (self.render_best is not None and self.render_best > 0)
+                if keep_labels:
+                    self.expand_labels()
+                result = Palette_Result(k, self.k_colors, self.cluster_sizes / self.cluster_sizes.sum(), sse_value,
+                                        self.labels if keep_labels else None, img_width, img_height, run_num,
+                                        self.seed)
+                # Create result visualization, unless only the best runs are rendered once all runs finish
+                if self.render_best is None:
+                    result.image_path = self.visualize_results(src_img, mode, img_width, img_height, run_num, k)
+                results.append((k, result))
+                if self.assign_pixels is not self.fit_pixels:
+                    # Compare the SSE the centroids were fitted on against the SSE over every pixel
+                    coreset_sse = k_means_utils.get_total_SSE(self.k_colors, self.fit_pixels, self.fit_labels,
+                                                              self.fit_weights)
+                    relative_error = (coreset_sse - sse_value) / sse_value if sse_value > 0 else 0.0
+                    logger.log(f"Coreset SSE: {coreset_sse} ({relative_error:+.2%} vs full SSE)")
+                logger.log(f"SSE: {sse_value} (k = {k})")
+                logger.log(f"\n{'~' * 18}\n")
+                if self.warm_start is not None:
+                    warm_k_colors, warm_labels = self.k_colors, self.fit_labels
+            except Exception as e:
+                print('Quitting current run due to error: ' + str(e))
+                logger.log('Quitting current run due to error: ' + str(e))
+                results.append((k, None))
+                # Seed the next k from scratch rather than from a failed run
+                warm_k_colors, warm_labels = None, None
+            finally:
+                # Clean up to reset k_colors for next run
+                self.k_colors = []
+        return results
+
+    ## Records SSE values, the latest result image path and the best result per k from a job's results, keeping
+    ## results to render later only while they are among the lowest-SSE runs for their k
+    # @param results - list of (k, Palette_Result or None) tuples from run_job
+    def record_job_results(self, results):
+        for k, result in results:
+            if result is None:
+                continue
+            self.SSE[k].append(result.SSE)
+            if result.image_path is not None:
+                self.result_img_path = result.image_path
+            # Ties go to the earlier run, so the outcome does not depend on the order jobs finish in
+            best_result = self.best_results[k]
+            if best_result is None or (result.SSE, result.run_num) < (best_result.SSE, best_result.run_num):
+                self.best_results[k] = result
+            if self.render_best is not None:
+                self.best_runs[k].append(result)
+                self.best_runs[k].sort(key=lambda best_run: (best_run.SSE, best_run.run_num))
+                del self.best_runs[k][self.render_best:]
+
+    ## Renders result images for the lowest-SSE runs of each k, kept by record_job_results
+    # @param src_img - PIL image of source image in Lab
+    # @param mode - mode of the image used for result images
+    # @param img_width - width of image
+    # @param img_height - height of image
+    # @param logger - instance of logger
+    def render_best_runs(self, src_img, mode, img_width, img_height, logger):
+        for k, best_runs in self.best_runs.items():
+            # Render in descending SSE order so the best run of the last k is the one reported
+            for result in reversed(best_runs):
+                self.k_colors, self.labels = result.k_colors, result.labels
+                self.cluster_sizes = result.proportions * (result.width * result.height)
+                result.image_path = self.visualize_results(src_img, mode, img_width, img_height, result.run_num, k)
+                self.result_img_path = result.image_path
+                logger.log(f"Rendered run #{result.run_num + 1} for k = {k} (SSE: {result.SSE}): "
+                           f"{result.image_path}")
+                if k != self.last_k:
+                    result.labels = None
+            best_runs.clear()
+        self.k_colors = []
 
     ## Runs k-means clustering algorithm once
     # @param src_image_array - PixelAccess array for source images
@@ -125,10 +474,12 @@ class K_Means:
     # @param w - width of image (int)
     # @param k - int for current value of k
     # @param logger - instance of logger
-    def run_k_means(self, src_image_array, h, w, k, logger):
+    # @param initial_k_colors - optional list of k tuples to start from instead of running seeding
+    def run_k_means(self, src_image_array, h, w, k, logger, initial_k_colors=None):
         # Use perf counter to track start time
         start_time = perf_counter()
         print('\nRunning k-means with k = ' + str(k))
+        self.num_reseeds = 0
 
         # Test exception handling and logging
         # if k % 2 == 0:
@@ -145,43 +496,45 @@ class K_Means:
         # logger.log("Initial k_colors (randomly selected): ")
         # logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
 
-        # Method 2: Get initial k colors via k-means++ selection
+        # Method 2: Get initial k colors via k-means++ (or k-means||) selection
+        seeding_name = self.seeding if initial_k_colors is None else f"warm start ({self.warm_start})"
         kmpp_start_time = perf_counter()
-        self.run_k_means_plus_plus(k)
+        if initial_k_colors is not None:
+            self.k_colors = initial_k_colors
+        elif self.engine == 'numpy':
+            seed_points, seed_weights = self.fit_pixels, self.fit_weights
+            if self.pyramid_sizes:
+                # Seed on the coarsest level of the pyramid
+                seed_points, seed_weights = self.pyramid_pixels[:self.pyramid_sizes[0]], None
+            elif self.fit_mode == 'minibatch':
+                # Seed from a sample of a few batches so seeding cost does not grow with image size
+                seed_idx = k_means_utils.sample_indices(len(self.fit_pixels), 3 * self.minibatch_size,
+                                                        self.fit_weights, self.rng)
+                seed_points, seed_weights = self.fit_pixels[seed_idx], None
+            if self.seeding == 'k-means||':
+                self.k_colors = k_means_utils.get_k_means_parallel_centroids(seed_points, k, seed_weights,
+                                                                             rng=self.rng)
+            elif self.seeding in quantizer_utils.QUANTIZERS:
+                self.k_colors = quantizer_utils.QUANTIZERS[self.seeding](seed_points, k, seed_weights, rng=self.rng)
+            else:
+                self.run_k_means_plus_plus_np(k, seed_points, seed_weights)
+        else:
+            self.run_k_means_plus_plus(k)
         kmpp_stop_time = perf_counter()
-        logger.log(f"Time elapsed for k-means++: {kmpp_stop_time - kmpp_start_time} seconds")
+        logger.log(f"Time elapsed for {seeding_name}: {kmpp_stop_time - kmpp_start_time} seconds")
 
         # Print and log initial k_colors
-        print("Initial k_colors (k-means++): ", self.k_colors)
-        logger.log("Initial k_colors (k-means++): ")
+        print(f"Initial k_colors ({seeding_name}): ", self.k_colors)
+        logger.log(f"Initial k_colors ({seeding_name}): ")
         logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
 
-        # Iteration number for logging
-        iteration_num = 0
-        # Boolean for whether the result k_colors changed in last iteration
-        result_changed = True
-
-        # Run algorithm until result no longer changes
-        while result_changed:
-            # Make copy of last iteration's palette
-            last_k_colors = self.k_colors[:]
-
-            # Wipe k_clusters first
-            self.k_clusters = [[] for _ in range(k)]
-
-            # Place all pixels into clusters, each ith cluster corresponds to ith color in k_colors
-            k_means_utils.group_pixels(self.src_pixels_with_coords, self.k_colors, self.k_clusters)
-
-            # Update k_colors by getting new representative color from each cluster,
-            ## where the representative color is the average color by RGB values
-            self.k_colors = k_means_utils.update_k_colors(self.k_clusters)
-
-            # Log updated k_colors with iteration number
-            iteration_num += 1
-            logger.log("[ " + str(iteration_num) + "]: " + k_means_utils.stringify_tuple_list(self.k_colors))
-
-            # Compare updated result with past result and update change boolean as needed
-            result_changed = not k_means_utils.compare_tuple_lists(self.k_colors, last_k_colors)
+        if self.fit_mode == 'minibatch':
+            self.run_mini_batch_iterations(k, logger)
+        elif self.pyramid_sizes and initial_k_colors is None:
+            self.run_pyramid_iterations(k, logger)
+        else:
+            self.run_lloyd_iterations(k, logger, self.fit_pixels, self.fit_labels, self.fit_weights,
+                                      self.max_iterations)
 
         # Print and log resulting k_colors
         print("Representative k_colors: ", self.k_colors)
@@ -189,11 +542,10 @@ class K_Means:
         logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
 
         # Sanity check for total pixels processed
-        total_pixels = 0
-        for cluster in self.k_clusters:
-            total_pixels += len(cluster)
+        total_pixels = round(np.bincount(self.fit_labels, weights=self.fit_weights, minlength=k).sum())
         print(f"Sum of cluster sizes: {total_pixels}")
-        logger.log(f"Sum of cluster sizes: {total_pixels}\n")
+        logger.log(f"Sum of cluster sizes: {total_pixels}")
+        logger.log(f"Empty clusters re-seeded: {self.num_reseeds}\n")
 
         # Use perf counter for end time and log time elapsed
         stop_time = perf_counter()
@@ -201,54 +553,325 @@ class K_Means:
         self.total_time += time_elapsed
         logger.log("Time elapsed for k-means algorithm: " + str(time_elapsed) + " seconds\n")
 
+    ## Runs k-means out of core: seeds on a sample drawn across the tiles, then runs Lloyd iterations that each
+    ## accumulate cluster counts and sums tile by tile, so only one tile of pixels and labels is in memory at a time
+    # @param k - int for current value of k
+    # @param logger - instance of logger
+    # @return tuple of (array of k cluster sizes, total SSE) for the final centroids
+    def run_tiled_k_means(self, k, logger):
+        start_time = perf_counter()
+        print('\nRunning tiled k-means with k = ' + str(k))
+        self.num_reseeds = 0
+
+        seed_start_time = perf_counter()
+        seed_points = tile_utils.get_tile_sample(self.fit_pixels, tile_utils.SEED_SAMPLE_SIZE, self.rng)
+        if self.seeding == 'k-means||':
+            self.k_colors = k_means_utils.get_k_means_parallel_centroids(seed_points, k, rng=self.rng)
+        elif self.seeding in quantizer_utils.QUANTIZERS:
+            self.k_colors = quantizer_utils.QUANTIZERS[self.seeding](seed_points, k, None, rng=self.rng)
+        else:
+            self.run_k_means_plus_plus_np(k, seed_points)
+        logger.log(f"Time elapsed for {self.seeding} on {len(seed_points)} sampled pixels: "
+                   f"{perf_counter() - seed_start_time} seconds")
+        print(f"Initial k_colors ({self.seeding}): ", self.k_colors)
+        logger.log(f"Initial k_colors ({self.seeding}): ")
+        logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
+
+        iteration_num = 0
+        stop_criterion = None
+        last_sse = None
+        while stop_criterion is None:
+            last_k_colors = self.k_colors[:]
+            # Keep k candidates for empty clusters, enough even if every cluster but one ends up empty
+            counts, sums, sse_value, farthest = tile_utils.get_tile_statistics(self.fit_pixels, self.k_colors,
+                                                                               self.tile_size, k)
+            num_reseeded = tile_utils.reseed_empty_clusters(counts, sums, farthest)
+            self.num_reseeds += num_reseeded
+            self.k_colors = tile_utils.get_tile_means(counts, sums, last_k_colors)
+
+            iteration_num += 1
+            logger.log("[ " + str(iteration_num) + "]: " + k_means_utils.stringify_tuple_list(self.k_colors))
+            if num_reseeded > 0:
+                logger.log(f"      re-seeded {num_reseeded} empty clusters ({self.empty_cluster_reseed})")
+
+            # SSE of each pass is against the previous centroids, so it trails the centroid shift by an iteration
+            max_shift = k_means_utils.get_max_shift(self.k_colors, last_k_colors)
+            if max_shift <= self.max_shift:
+                stop_criterion = f"max centroid shift {max_shift:.4f} <= {self.max_shift}"
+            if stop_criterion is None and self.sse_tolerance is not None:
+                if last_sse is not None and last_sse > 0 and (last_sse - sse_value) / last_sse < self.sse_tolerance:
+                    stop_criterion = (f"relative SSE improvement {(last_sse - sse_value) / last_sse:.6f} < "
+                                      f"{self.sse_tolerance}")
+                last_sse = sse_value
+            if stop_criterion is None and self.max_iterations is not None and iteration_num >= self.max_iterations:
+                stop_criterion = f"reached max iterations ({self.max_iterations})"
+
+        print(f"Stopped after {iteration_num} iterations: {stop_criterion}")
+        logger.log(f"Stopped after {iteration_num} iterations: {stop_criterion}")
+
+        # One more pass for the cluster sizes and SSE of the final centroids
+        counts, _, sse_value, _ = tile_utils.get_tile_statistics(self.fit_pixels, self.k_colors, self.tile_size)
+
+        print("Representative k_colors: ", self.k_colors)
+        logger.log("\nRepresentative k_colors: ")
+        logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
+        print(f"Sum of cluster sizes: {round(counts.sum())}")
+        logger.log(f"Sum of cluster sizes: {round(counts.sum())}")
+        logger.log(f"Empty clusters re-seeded: {self.num_reseeds}\n")
+
+        time_elapsed = perf_counter() - start_time
+        self.total_time += time_elapsed
+        logger.log("Time elapsed for tiled k-means algorithm: " + str(time_elapsed) + " seconds\n")
+        return counts, sse_value
+
+    ## Labels every point with the centroids fitted on the coreset in a single pass
+    # @param logger - instance of logger
+    def run_full_assignment(self, logger):
+        start_time = perf_counter()
+        k_means_utils.get_labels_np(self.assign_pixels, self.k_colors, labels=self.assign_labels)
+        time_elapsed = perf_counter() - start_time
+        self.total_time += time_elapsed
+        logger.log(f"Time elapsed for full assignment: {time_elapsed} seconds")
+
+    ## Finds k colors with a histogram-based quantizer, then labels the fit pixels once so the results and SSE are
+    ## produced the same way as for k-means
+    # @param k - int for current value of k
+    # @param logger - instance of logger
+    def run_quantizer(self, k, logger):
+        start_time = perf_counter()
+        print(f"\nRunning {self.algorithm} with k = {k}")
+        self.k_colors = quantizer_utils.QUANTIZERS[self.algorithm](self.fit_pixels, k, self.fit_weights,
+                                                                   rng=self.rng)
+        k_means_utils.get_labels_np(self.fit_pixels, self.k_colors, labels=self.fit_labels)
+
+        # Print and log resulting k_colors
+        print("Representative k_colors: ", self.k_colors)
+        logger.log(f"\nRepresentative k_colors ({self.algorithm}): ")
+        logger.log(k_means_utils.stringify_tuple_list(self.k_colors) + '\n')
+
+        time_elapsed = perf_counter() - start_time
+        self.total_time += time_elapsed
+        logger.log(f"Time elapsed for {self.algorithm}: {time_elapsed} seconds\n")
+
+    ## Converges on the coarsest pyramid level, then refines the centroids with a few Lloyd iterations at each finer
+    ## level, ending with the full-size fit pixels
+    # @param k - int for current value of k
+    # @param logger - instance of logger
+    def run_pyramid_iterations(self, k, logger):
+        levels = np.split(self.pyramid_pixels, np.cumsum(self.pyramid_sizes)[:-1])
+        num_levels = len(levels) + 1
+        for level_num, level_pixels in enumerate(levels):
+            logger.log(f"Pyramid level {level_num + 1} of {num_levels}: {len(level_pixels)} pixels")
+            level_labels = np.zeros(len(level_pixels), dtype=self.fit_labels.dtype)
+            max_iterations = self.max_iterations if level_num == 0 else self.refine_iterations
+            self.run_lloyd_iterations(k, logger, level_pixels, level_labels, None, max_iterations)
+        logger.log(f"Pyramid level {num_levels} of {num_levels}: {len(self.fit_pixels)} pixels")
+        self.run_lloyd_iterations(k, logger, self.fit_pixels, self.fit_labels, self.fit_weights,
+                                  self.refine_iterations)
+
+    ## Runs Lloyd iterations over the given points until one of the convergence criteria is met
+    # @param k - int for current value of k
+    # @param logger - instance of logger
+    # @param pixels - array of points to cluster
+    # @param labels - array of cluster indices for pixels, updated in place
+    # @param weights - array of weights for pixels, or None if every point counts once
+    # @param max_iterations - optional int hard cap on the number of iterations
+    def run_lloyd_iterations(self, k, logger, pixels, labels, weights, max_iterations):
+        # Iteration number for logging
+        iteration_num = 0
+        # Description of the criterion that stopped the iterations, None while still running
+        stop_criterion = None
+        # SSE after the last iteration, for the relative SSE improvement criterion
+        last_sse = None
+        # Bounds carried across iterations for accelerated assignment
+        hamerly_bounds = Hamerly_Bounds(pixels) if self.assignment == 'hamerly' else None
+
+        # Run algorithm until a convergence criterion is met
+        while stop_criterion is None:
+            # Make copy of last iteration's palette
+            last_k_colors = self.k_colors[:]
+
+            num_skipped = None
+            if self.engine == 'numpy':
+                # Label all pixels with their closest color
+                if hamerly_bounds is not None:
+                    num_skipped = hamerly_bounds.assign(self.k_colors, labels)
+                else:
+                    k_means_utils.get_labels_np(pixels, self.k_colors, labels=labels)
+            else:
+                # Label all pixels with their cluster, each ith cluster corresponds to ith color in k_colors
+                k_means_utils.group_pixels(pixels, self.k_colors, labels)
+
+            # Move some pixels into any cluster left empty, so every cluster has an average; a cluster can only stay
+            ## empty when there are fewer distinct colors than k, and then it keeps its last color
+            num_reseeded = k_means_utils.reseed_empty_clusters(pixels, labels, self.k_colors, weights,
+                                                               self.empty_cluster_reseed)
+            if num_reseeded > 0:
+                self.num_reseeds += num_reseeded
+                # Relabelled pixels no longer match their bounds
+                if hamerly_bounds is not None:
+                    hamerly_bounds.reset()
+
+            if self.engine == 'numpy':
+                # Average each label group
+                self.k_colors = k_means_utils.update_k_colors_np(pixels, labels, k, weights, last_k_colors)
+            else:
+                # Update k_colors by getting new representative color from each cluster,
+                ## where the representative color is the average color by RGB values
+                self.k_colors = k_means_utils.update_k_colors(pixels, labels, k, last_k_colors)
+
+            # Log updated k_colors with iteration number
+            iteration_num += 1
+            logger.log("[ " + str(iteration_num) + "]: " + k_means_utils.stringify_tuple_list(self.k_colors))
+            if num_skipped is not None:
+                logger.log(f"      skipped {num_skipped} of {len(pixels) * k} distance evaluations")
+            if num_reseeded > 0:
+                logger.log(f"      re-seeded {num_reseeded} empty clusters ({self.empty_cluster_reseed})")
+
+            # Check convergence criteria against the last iteration
+            max_shift = k_means_utils.get_max_shift(self.k_colors, last_k_colors)
+            if max_shift <= self.max_shift:
+                stop_criterion = f"max centroid shift {max_shift:.4f} <= {self.max_shift}"
+            if stop_criterion is None and self.sse_tolerance is not None:
+                sse_value = k_means_utils.get_total_SSE(self.k_colors, pixels, labels, weights)
+                if last_sse is not None and last_sse > 0 and (last_sse - sse_value) / last_sse < self.sse_tolerance:
+                    stop_criterion = (f"relative SSE improvement {(last_sse - sse_value) / last_sse:.6f} < "
+                                      f"{self.sse_tolerance}")
+                last_sse = sse_value
+            if stop_criterion is None and max_iterations is not None and iteration_num >= max_iterations:
+                stop_criterion = f"reached max iterations ({max_iterations})"
+
+        print(f"Stopped after {iteration_num} iterations: {stop_criterion}")
+        logger.log(f"Stopped after {iteration_num} iterations: {stop_criterion}")
+
+    ## Runs a fixed number of minibatch iterations, then assigns every pixel once so SSE covers the whole image
+    # @param k - int for current value of k
+    # @param logger - instance of logger
+    def run_mini_batch_iterations(self, k, logger):
+        centroids = np.asarray(self.k_colors, dtype=np.float64)
+        # Number of pixels each centroid has absorbed so far, which sets its learning rate
+        centroid_counts = np.zeros(k)
+        for iteration_num in range(1, self.minibatch_iterations + 1):
+            batch_idx = k_means_utils.sample_indices(len(self.fit_pixels), self.minibatch_size, self.fit_weights,
+                                                     self.rng)
+            batch = self.fit_pixels[batch_idx]
+            batch_labels = k_means_utils.get_labels_np(batch, centroids)
+            k_means_utils.update_mini_batch_centroids(centroids, centroid_counts, batch, batch_labels)
+            # Log updated k_colors with iteration number
+            self.k_colors = [tuple(color) for color in centroids.tolist()]
+            logger.log("[ " + str(iteration_num) + "]: " + k_means_utils.stringify_tuple_list(self.k_colors))
+
+        # Single full assignment pass so the labels, SSE and result images cover every pixel
+        k_means_utils.get_labels_np(self.fit_pixels, self.k_colors, labels=self.fit_labels)
+        print(f"Stopped after {self.minibatch_iterations} iterations: iteration budget")
+        logger.log(f"Stopped after {self.minibatch_iterations} iterations: iteration budget")
+
     ## Function to update self.k_colors with k initial centroids using k-means++
     # @param k - int value of k for current run
     #
     def run_k_means_plus_plus(self, k):
         print(f"Running k_means++ to select {k} centroids\n")
         # Initially select one pixel at random
-        ## NB choices returns list of 1 item by default, use [0] to access pixel, [1] to access its RGB tuple
-        self.k_colors.append(choices(self.src_pixels_with_coords)[0][1])
-        # Create list of weights proportional to sq dist of each pixel to nearest selected center
-        weights = []
-        for i in range(len(self.src_pixels_with_coords)):
-            curr_pixel = self.src_pixels_with_coords[i][1]
-            weights.append(k_means_utils.get_weight(self.k_colors, curr_pixel))
+        num_pixels = len(self.fit_pixels)
+        first_idx = k_means_utils.choose_weighted_index(np.ones(num_pixels), self.rng)
+        self.k_colors.append(tuple(self.fit_pixels[first_idx].tolist()))
+        # Create array of weights proportional to sq dist of each pixel to nearest selected center
+        weights = np.empty(num_pixels)
+        for i in range(num_pixels):
+            curr_pixel = tuple(self.fit_pixels[i].tolist())
+            weights[i] = k_means_utils.get_weight(self.k_colors, curr_pixel)
         # While not k have been chosen:
         while len(self.k_colors) < k:
             # Choose next center
-            self.k_colors.append(choices(self.src_pixels_with_coords, weights=weights)[0][1])
-            # Update weights
-            for i in range(len(self.src_pixels_with_coords)):
-                curr_pixel = self.src_pixels_with_coords[i][1]
-                weights[i] = k_means_utils.get_weight(self.k_colors, curr_pixel)
+            next_idx = k_means_utils.choose_weighted_index(weights, self.rng)
+            new_centroid = tuple(self.fit_pixels[next_idx].tolist())
+            self.k_colors.append(new_centroid)
+            # Update weights, only the newly added center can bring a pixel's nearest center closer
+            for i in range(num_pixels):
+                curr_pixel = tuple(self.fit_pixels[i].tolist())
+                distance = k_means_utils.get_sq_euclidean_dist(new_centroid, curr_pixel)
+                if distance < weights[i]:
+                    weights[i] = distance
+
+    ## Vectorized version of run_k_means_plus_plus for the numpy engine
+    # @param k - int value of k for current run
+    # @param points - optional array of points to pick centroids from, defaults to fit_pixels
+    # @param point_weights - optional array of weights for points, defaults to fit_weights when points not given
+    #
+    def run_k_means_plus_plus_np(self, k, points=None, point_weights=None):
+        print(f"Running k_means++ to select {k} centroids\n")
+        if points is None:
+            points, point_weights = self.fit_pixels, self.fit_weights
+        self.k_colors = k_means_utils.get_k_means_plus_plus_centroids(points, k, point_weights, self.rng)
+
+    ## Builds initial k_colors for k from the converged result of a smaller k
+    # @param prev_k_colors - converged k_colors of the previous k (list of tuples)
+    # @param prev_labels - converged fit_labels of the previous k
+    # @param k - int for current value of k
+    # @return list of k tuples
+    #
+    def get_warm_start_colors(self, prev_k_colors, prev_labels, k):
+        num_new = k - len(prev_k_colors)
+        if self.warm_start == 'split':
+            return k_means_utils.split_clusters(self.fit_pixels, prev_labels, prev_k_colors, num_new,
+                                                self.fit_weights, self.rng)
+        return k_means_utils.add_k_means_plus_plus_centroids(self.fit_pixels, prev_k_colors, num_new,
+                                                             self.fit_weights, self.rng)
+
+    ## Expands unique color labels back to per-pixel labels, only once a label map is kept or rendered
+    #
+    def expand_labels(self):
+        if self.labels is None and self.unique_keys is not None:
+            self.labels = k_means_utils.expand_unique_labels(self.src_pixels, self.unique_keys, self.assign_labels)
 
     ## Function to create result images showing the palette
-    # @param src_image_array - image array of source image
+    # @param src_img - PIL image of source image
     # @param mode - mode of source image (used for making a copy)
     # @param img_width - width of original image (used for making a copy)
     # @param img_height - height of original image (used for making a copy)
     # @param run_num - number of the current run (used in image path)
     # @param k - k value of current run (used in image path)
     #
-    def visualize_results(self, src_image_array, mode, img_width, img_height, run_num, k):
+    def visualize_results(self, src_img, mode, img_width, img_height, run_num, k):
+        self.expand_labels()
+        # Centroids are kept in floating point, so round them to pixel values for the images
+        palette_colors = k_means_utils.get_rounded_colors(self.k_colors)
+        # Tiled results are streamed out row by row, which PNG allows
+        img_extension = self.img_extension if self.tile_size is None else ".png"
+
         # Create the palette appended to original image
         palette_img_path = (f"./results/{k_means_utils.get_timestamp_str()}__{self.project_name}_run_{run_num + 1}_k_"
-                            f"{k}{self.img_extension}")
+                            f"{k}{img_extension}")
         # palette_img_path = f"./results/{self.project_name}{self.img_extension}"
-        palette_img = palette_utils.create_appended_palette(src_image_array, mode, img_width, img_height,
-                                                            self.k_colors, self.k_clusters)
-        palette_img.save(palette_img_path)
-        palette_img.close()
+        if self.tile_size is not None:
+            self.image_writer.submit(palette_img_path, tile_utils.save_appended_palette, palette_img_path,
+                                     self.src_pixels, img_width, img_height, palette_colors, self.cluster_sizes,
+                                     self.tile_size)
+        else:
+            palette_img = palette_utils.create_appended_palette(src_img, mode, img_width, img_height,
+                                                                palette_colors, self.labels)
+            self.image_writer.save_image(palette_img, palette_img_path)
 
         # Create copy of original with pixels replaced by representative colors
         if self.palette_replace:
             reduced_image_path = (f"./results/{k_means_utils.get_timestamp_str()}__{self.project_name}_[r]_run_"
-                                  f"{run_num + 1}_k_{k}{self.img_extension}")
-            reduced_image = palette_utils.create_reduced_image(mode, img_width, img_height,
-                                                               self.k_clusters, self.k_colors)
-            reduced_image.save(reduced_image_path)
-            reduced_image.close()
+                                  f"{run_num + 1}_k_{k}{img_extension}")
+            if self.tile_size is not None:
+                # Label each tile against the centroids again rather than keeping labels for every pixel
+                self.image_writer.submit(reduced_image_path, tile_utils.save_reduced_image, reduced_image_path,
+                                         self.src_pixels, img_width, img_height, self.k_colors, palette_colors,
+                                         self.tile_size)
+            else:
+                reduced_image = palette_utils.create_reduced_image(mode, img_width, img_height,
+                                                                   self.labels, palette_colors)
+                self.image_writer.save_image(reduced_image, reduced_image_path)
+
+        # Export the palette mapping as a 3D LUT alongside each result, to apply to other images or video frames
+        lut_path = (f"./results/{k_means_utils.get_timestamp_str()}__{self.project_name}_[lut]_run_"
+                    f"{run_num + 1}_k_{k}.cube")
+        self.image_writer.submit(lut_path, palette_utils.save_cube_lut,
+                                 palette_utils.create_palette_lut(palette_colors), lut_path,
+                                 f"{self.project_name} k = {k}")
 
         # Return palette image path for server
         return palette_img_path
@@ -0,0 +1,21 @@
+## Name: Eddie Wu
+## Description: Class to collect log lines in memory, e.g. in worker processes that cannot share the log file
+
+class Memory_Logger:
+    ## Constructor
+    # lines: list of logged lines, in order
+    def __init__(self):
+        self.lines = []
+
+    ## Enter method for context manager
+    def __enter__(self):
+        return self
+
+    ## Method for recording a single line
+    # @param line - string for a single line
+    def log(self, line):
+        self.lines.append(line)
+
+    ## Exit method for context manager
+    def __exit__(self, exception_type, exception_object, exception_traceback):
+        pass
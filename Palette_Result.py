@@ -0,0 +1,115 @@
+## Name: Eddie Wu
+## Description: Class for the outcome of one k-means run at one k: palette, cluster proportions, SSE and label map,
+##              with JSON and compact binary serializers so clients need not download rendered images
+
+import json
+import struct
+import zlib
+import numpy as np
+import k_means_utils
+import palette_utils
+
+# Binary layout: header, then k rounded Lab colors (3 bytes each), k sRGB colors (3 bytes each), k float32
+# proportions, then optionally the zlib-compressed label map (one uint8 or uint16 per pixel, row by row)
+BINARY_MAGIC = b'PALT'
+BINARY_VERSION = 1
+# magic, version, flags, k, width, height, run number, seed, SSE
+BINARY_HEADER = struct.Struct('<4sBBHIIIQd')
+# Flag bit set when the label map is included
+FLAG_LABELS = 1
+
+
+class Palette_Result:
+    ## Constructor
+    # @param k - number of colors
+    # @param k_colors - list of k Lab tuples (a and b offset by 128, like PixelAccess reports them)
+    # @param proportions - array of k fractions of the image's pixels in each cluster
+    # @param SSE - total SSE of the run
+    # @param labels - optional array of cluster indices per pixel, pixel (x, y) at index y * width + x
+    # @param width - width of the clustered image
+    # @param height - height of the clustered image
+    # @param run_num - number of the run (from 0)
+    # @param seed - base seed of the K_Means process, which replays the run together with run_num and k
+    # image_path: path of the rendered palette image, None if it was not rendered
+    def __init__(self, k, k_colors, proportions, SSE, labels, width, height, run_num, seed):
+        self.k = k
+        self.k_colors = k_colors
+        self.proportions = np.asarray(proportions, dtype=np.float64)
+        self.SSE = SSE
+        self.labels = labels
+        self.width = width
+        self.height = height
+        self.run_num = run_num
+        self.seed = seed
+        self.image_path = None
+
+    ## Returns the palette as sRGB colors
+    # @return list of k (r, g, b) tuples
+    #
+    def get_rgb_colors(self):
+        lab_colors = np.array(k_means_utils.get_rounded_colors(self.k_colors), dtype=np.uint8).reshape(-1, 3)
+        return [tuple(color) for color in palette_utils.get_rgb_colors(lab_colors).tolist()]
+
+    ## Returns the palette, proportions and SSE as plain types, without the label map
+    # @return dict that can be dumped as JSON
+    #
+    def to_dict(self):
+        colors = []
+        for lab_color, rgb_color, proportion in zip(k_means_utils.get_rounded_colors(self.k_colors),
+                                                    self.get_rgb_colors(), self.proportions.tolist()):
+            colors.append({
+                'rgb': list(rgb_color),
+                'hex': '#' + ''.join(f'{value:02x}' for value in rgb_color),
+                # CIE Lab, undoing the 8-bit encoding of L and the offset of a and b
+                'lab': [round(lab_color[0] * 100 / 255, 2), lab_color[1] - 128, lab_color[2] - 128],
+                'proportion': proportion,
+            })
+        return {'k': self.k, 'colors': colors, 'SSE': self.SSE, 'width': self.width, 'height': self.height,
+                'run': self.run_num + 1, 'seed': self.seed}
+
+    ## Serializes the palette, proportions and SSE as JSON
+    # @return JSON string
+    #
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    ## Serializes the result into the compact binary layout
+    # @param include_labels - bool for whether to append the label map
+    # @return bytes
+    #
+    def to_bytes(self, include_labels=True):
+        if not 0 <= self.seed < 1 << 64:
+            raise ValueError(f"Seed does not fit the binary layout: {self.seed}")
+        include_labels = include_labels and self.labels is not None
+        lab_colors = np.array(k_means_utils.get_rounded_colors(self.k_colors), dtype=np.uint8).reshape(-1, 3)
+        parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, FLAG_LABELS if include_labels else 0, self.k,
+                                    self.width, self.height, self.run_num, self.seed, self.SSE),
+                 lab_colors.tobytes(), palette_utils.get_rgb_colors(lab_colors).tobytes(),
+                 self.proportions.astype('<f4').tobytes()]
+        if include_labels:
+            label_dtype = np.dtype(k_means_utils.get_label_dtype(self.k)).newbyteorder('<')
+            parts.append(zlib.compress(np.asarray(self.labels, dtype=label_dtype).tobytes()))
+        return b''.join(parts)
+
+    ## Rebuilds a result from the binary layout
+    ## NB colors come back rounded to pixel values and proportions as float32, and the image path is not kept
+    # @param data - bytes from to_bytes
+    # @return Palette_Result
+    #
+    @staticmethod
+    def from_bytes(data):
+        magic, version, flags, k, width, height, run_num, seed, SSE = BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError("Not a palette result")
+        offset = BINARY_HEADER.size
+        lab_colors = np.frombuffer(data, dtype=np.uint8, count=3 * k, offset=offset).reshape(-1, 3)
+        # Skip the sRGB colors, which follow from the Lab colors
+        offset += 6 * k
+        proportions = np.frombuffer(data, dtype='<f4', count=k, offset=offset)
+        offset += 4 * k
+        labels = None
+        if flags & FLAG_LABELS:
+            label_dtype = np.dtype(k_means_utils.get_label_dtype(k)).newbyteorder('<')
+            labels = np.frombuffer(zlib.decompress(data[offset:]), dtype=label_dtype)
+        return Palette_Result(k, [tuple(color) for color in lab_colors.tolist()], proportions, SSE, labels, width,
+                              height, run_num, seed)
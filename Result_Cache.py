@@ -0,0 +1,138 @@
+## Name: Eddie Wu
+## Description: Class for an on-disk cache of palette results keyed by the image's content and the parameters,
+##              evicting the least recently used results once it grows past a size limit
+
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from Palette_Result import Palette_Result
+
+# Default location and size limit of the cache
+RESULT_CACHE_DIR = "./cache/results"
+RESULT_CACHE_MAX_BYTES = 256 << 20
+# Extension of the serialized palette result of each entry; an entry's result image keeps its own extension
+PALETTE_EXTENSION = ".palette"
+
+
+class Result_Cache:
+    ## Constructor: picks up entries already on disk, most recently used last
+    # @param cache_dir - directory holding the cached files, created if missing
+    # @param max_bytes - total size of cached files above which least recently used entries are evicted
+    # entries: OrderedDict mapping key to (list of file names, total bytes), least recently used first
+    # total_bytes: total size of cached files
+    # hits: number of lookups answered from the cache
+    # misses: number of lookups not found in the cache
+    # lock: guards the entries and counters, which requests on different threads share
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        entry_files = {}
+        for entry in os.scandir(cache_dir):
+            # Skip files still being written
+            if entry.is_file() and not entry.name.startswith('.'):
+                entry_files.setdefault(entry.name.split('.', 1)[0], []).append(entry)
+        for key, files in sorted(entry_files.items(), key=lambda item: max(file.stat().st_mtime for file in item[1])):
+            self.entries[key] = ([file.name for file in files], sum(file.stat().st_size for file in files))
+            self.total_bytes += self.entries[key][1]
+
+    ## Returns the cache key of an image and the parameters its result depends on
+    # @param image_bytes - contents of the image file
+    # @param params - parameters of the result, e.g. (k, resize_level, algorithm, seed)
+    # @return hex string
+    #
+    @staticmethod
+    def get_key(image_bytes, *params):
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        return hashlib.sha256(f"{image_hash}|{params!r}".encode()).hexdigest()
+
+    ## Looks up a cached result, counting the hit or miss
+    # @param key - cache key from get_key
+    # @param need_image - bool for whether only results with a result image count as a hit
+    # @return Palette_Result with image_path pointing into the cache if it has an image, None on a miss
+    #
+    def get(self, key, need_image=False):
+        with self.lock:
+            file_names = self.entries[key][0] if key in self.entries else []
+            image_names = [name for name in file_names if not name.endswith(PALETTE_EXTENSION)]
+            if not file_names or (need_image and not image_names):
+                self.misses += 1
+                return None
+            palette_path = os.path.join(self.cache_dir, key + PALETTE_EXTENSION)
+            try:
+                with open(palette_path, 'rb') as palette_file:
+                    data = palette_file.read()
+                # Keep the recency on disk too, so it survives restarts
+                os.utime(palette_path)
+            except OSError:
+                # Removed from under the cache, so forget it
+                self.remove_entry(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        result = Palette_Result.from_bytes(data)
+        if image_names:
+            result.image_path = os.path.join(self.cache_dir, image_names[0])
+        return result
+
+    ## Stores a result with its label map and, if it was rendered, a copy of its result image
+    # @param key - cache key from get_key
+    # @param result - Palette_Result, with its image (if any) already on disk
+    #
+    def put(self, key, result):
+        file_names = [key + PALETTE_EXTENSION]
+        self.write_file(file_names[0], result.to_bytes())
+        if result.image_path is not None and os.path.exists(result.image_path):
+            file_names.append(key + os.path.splitext(result.image_path)[1])
+            with open(result.image_path, 'rb') as image_file:
+                self.write_file(file_names[1], image_file)
+        entry_bytes = sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in file_names)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key][1]
+            self.entries[key] = (file_names, entry_bytes)
+            self.entries.move_to_end(key)
+            self.total_bytes += entry_bytes
+            # Evict least recently used entries, but always keep the newest one
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                self.remove_entry(next(iter(self.entries)))
+
+    ## Writes a file into the cache under a temporary name first, so readers never see a partial file
+    # @param name - file name within the cache directory
+    # @param contents - bytes, or a binary file object to copy from
+    def write_file(self, name, contents):
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix='.', delete=False) as tmp_file:
+            if isinstance(contents, bytes):
+                tmp_file.write(contents)
+            else:
+                shutil.copyfileobj(contents, tmp_file)
+        os.replace(tmp_file.name, os.path.join(self.cache_dir, name))
+
+    ## Deletes an entry and its files; the caller must hold the lock
+    # @param key - cache key of the entry
+    def remove_entry(self, key):
+        file_names, entry_bytes = self.entries.pop(key)
+        self.total_bytes -= entry_bytes
+        for name in file_names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    ## Returns the cache's counters
+    # @return dict of hits, misses, number of entries and total bytes
+    #
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                    'bytes': self.total_bytes}
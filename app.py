@@ -1,20 +1,28 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS, cross_origin
+import os
 import sys
 from K_Means import K_Means
-from k_means_utils import get_timestamp_str
+from k_means_utils import MAX_SEED, get_timestamp_str
+from quantizer_utils import QUANTIZERS
+from Result_Cache import Result_Cache
 
 app = Flask(__name__)
 CORS(app)
 
 APP_PATH = "http://127.0.0.1:8000"
-result_path = ""
+# Palette_Result of the last upload
+result = None
+# Formats /result can be negotiated to with the Accept header, the rendered image first as the default
+RESULT_TYPES = ['image/jpeg', 'application/json', 'application/octet-stream']
+# Results of earlier uploads, so repeating an image with the same parameters skips decoding and clustering
+result_cache = Result_Cache()
 
 
 @app.route('/upload', methods=['POST'])
 @cross_origin()
 def upload_image():
-    global result_path
+    global result
     # Check for missing file
     if 'imageFile' not in request.files:
         print("No file received", file=sys.stderr)  # Print error message to stderr
@@ -22,12 +30,26 @@ def upload_image():
     # Get file and k value
     file = request.files['imageFile']
     k = int(request.form['k'])
+    # Optional fit mode: 'minibatch' bounds latency regardless of image size
+    fit_mode = request.form.get('mode', 'lloyd')
+    if fit_mode not in ('lloyd', 'minibatch'):
+        return jsonify({'message': f'Unknown mode: {fit_mode}'}), 400
+    # Optional algorithm: a histogram-based quantizer ('median cut', 'octree', 'wu') answers in milliseconds
+    algorithm = request.form.get('algorithm', 'k-means')
+    if algorithm != 'k-means' and algorithm not in QUANTIZERS:
+        return jsonify({'message': f'Unknown algorithm: {algorithm}'}), 400
+    if algorithm != 'k-means' and fit_mode != 'lloyd':
+        return jsonify({'message': 'Minibatch mode only applies to k-means'}), 400
+    # Optional seed to replay a previous result exactly
+    seed = request.form.get('seed')
+    if seed is not None and (not seed.isdecimal() or int(seed) >= MAX_SEED):
+        return jsonify({'message': f'Invalid seed: {seed}'}), 400
+    # Optional output: 'palette' skips rendering images, for clients that only need the palette data
+    output = request.form.get('output', 'image')
+    if output not in ('image', 'palette'):
+        return jsonify({'message': f'Unknown output: {output}'}), 400
 
     if file:
-        # Save file into src_images
-        file_path = "src_images/" + file.filename
-        file.save(file_path)
-
         # Run k-means
         project_name = file.filename.rsplit(".", 1)[0]  # Get filename w/o extension
         k_values = (k, k, 1)
@@ -37,18 +59,54 @@ def upload_image():
         resize_level = 100
         log_file_name = f"{get_timestamp_str()}__{project_name}_{str(num_runs)}x_{k_values[0]}"
         # END DEFAULTS
+        seed = None if seed is None else int(seed)
+        # Without a seed any earlier result for the same image is as good as a new one, and its seed replays it
+        image_bytes = file.read()
+        cache_key = Result_Cache.get_key(image_bytes, k, resize_level, fit_mode, algorithm, seed)
+        cached_result = result_cache.get(cache_key, need_image=output == 'image')
+        if cached_result is not None:
+            result = cached_result
+            return jsonify({'message': f'File {file.filename} received with number {k}', 'seed': result.seed,
+                            'cached': True, 'palette': result.to_dict()}), 200
+
+        # Save file into src_images
+        file_path = "src_images/" + file.filename
+        with open(file_path, 'wb') as src_file:
+            src_file.write(image_bytes)
         k_means_process = K_Means(project_name, k_values, file_path, num_runs, log_file_name, img_extension,
-                                  palette_replace, resize_level)
-        result_path = k_means_process.run()
+                                  palette_replace, resize_level, fit_mode=fit_mode, algorithm=algorithm, seed=seed,
+                                  render_best=0 if output == 'palette' else None)
+        result = k_means_process.run()
+        if result is None:
+            return jsonify({'message': 'Palette extraction failed'}), 500
+        result_cache.put(cache_key, result)
 
-        return jsonify({'message': f'File {file.filename} received with number {k}'}), 200
+        return jsonify({'message': f'File {file.filename} received with number {k}',
+                        'seed': k_means_process.seed, 'cached': False, 'palette': result.to_dict()}), 200
 
 
 @app.route('/result', methods=['GET'])
 @cross_origin()
 def get_result():
-    actual_path = result_path.rsplit("/", 1)[1]
-    return send_from_directory("./results", actual_path)
+    if result is None:
+        return jsonify({'message': 'No result yet'}), 404
+    # Serve the palette as JSON or as the compact binary layout (with the label map) if the client prefers it
+    result_type = request.accept_mimetypes.best_match(RESULT_TYPES, default=RESULT_TYPES[0])
+    if result_type == 'application/json':
+        return jsonify(result.to_dict())
+    if result_type == 'application/octet-stream':
+        return Response(result.to_bytes(), mimetype='application/octet-stream')
+    if result.image_path is None:
+        return jsonify({'message': 'No image was rendered for this result'}), 404
+    # The image is either in the results or in the result cache
+    image_path = os.path.abspath(result.image_path)
+    return send_from_directory(os.path.dirname(image_path), os.path.basename(image_path))
+
+
+@app.route('/cache', methods=['GET'])
+@cross_origin()
+def get_cache_stats():
+    return jsonify(result_cache.get_stats())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+## Name: Eddie Wu
+## Description: Module for sRGB <-> Lab conversions with transforms built once per process and shared between threads
+
+import threading
+from PIL import Image, ImageCms
+import numpy as np
+
+# Transforms by (input mode, output mode), built on first use
+_transforms = {}
+# Lazily built table of the Lab value of every 24-bit sRGB color
+_rgb_to_lab_table = None
+# Guards building the transforms and the table; applying a transform needs no lock, since littleCMS transforms can
+## be shared between threads
+_build_lock = threading.RLock()
+
+
+## Returns the transform between sRGB and Lab in the given direction, building it on first use
+# @param in_mode - 'RGB' or 'LAB'
+# @param out_mode - 'LAB' or 'RGB'
+# @return ImageCms transform
+#
+def get_transform(in_mode, out_mode):
+    transform = _transforms.get((in_mode, out_mode))
+    if transform is None:
+        with _build_lock:
+            transform = _transforms.get((in_mode, out_mode))
+            if transform is None:
+                profiles = {"RGB": ImageCms.createProfile("sRGB"), "LAB": ImageCms.createProfile("LAB")}
+                transform = ImageCms.buildTransformFromOpenProfiles(profiles[in_mode], profiles[out_mode],
+                                                                    in_mode, out_mode)
+                _transforms[(in_mode, out_mode)] = transform
+    return transform
+
+
+## Converts an image to Lab
+# @param img - PIL image, converted to RGB first if it is in another mode
+# @return PIL image object in LAB mode
+#
+def rgb_to_lab_image(img):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return ImageCms.applyTransform(img, get_transform("RGB", "LAB"))
+
+
+## Converts a Lab image to sRGB
+# @param img - PIL image in LAB mode
+# @return PIL image object in RGB mode
+#
+def lab_to_rgb_image(img):
+    return ImageCms.applyTransform(img, get_transform("LAB", "RGB"))
+
+
+## Converts a buffer of sRGB pixels to Lab, a and b offset by 128 like PixelAccess reports them
+# @param pixels - N x 3 uint8 array of sRGB values
+# @param out - optional N x 3 uint8 array to write into, which may be pixels itself
+# @param use_table - bool for whether to look values up in the precomputed table instead of transforming them
+# @return N x 3 uint8 array of Lab values
+#
+def rgb_to_lab_pixels(pixels, out=None, use_table=False):
+    if out is None:
+        out = np.empty_like(pixels, dtype=np.uint8)
+    if use_table:
+        keys = (pixels[:, 0].astype(np.int64) << 16) | (pixels[:, 1].astype(np.int64) << 8) | pixels[:, 2]
+        out[...] = get_rgb_to_lab_table()[keys]
+        return out
+    rgb_img = Image.frombytes("RGB", (len(pixels), 1), np.ascontiguousarray(pixels, dtype=np.uint8).tobytes())
+    out[...] = np.frombuffer(rgb_to_lab_image(rgb_img).tobytes(), dtype=np.uint8).reshape(-1, 3)
+    # PIL stores a and b as signed bytes internally, so restore the offset of 128
+    out[:, 1:] ^= 128
+    return out
+
+
+## Converts a buffer of Lab pixels (a and b offset by 128) to sRGB
+# @param pixels - N x 3 uint8 array of Lab values
+# @param out - optional N x 3 uint8 array to write into, which may be pixels itself
+# @return N x 3 uint8 array of sRGB values
+#
+def lab_to_rgb_pixels(pixels, out=None):
+    if out is None:
+        out = np.empty_like(pixels, dtype=np.uint8)
+    raw_pixels = np.array(pixels, dtype=np.uint8)
+    raw_pixels[:, 1:] ^= 128
+    lab_img = Image.frombytes("LAB", (len(raw_pixels), 1), raw_pixels.tobytes())
+    out[...] = np.asarray(lab_to_rgb_image(lab_img)).reshape(-1, 3)
+    return out
+
+
+## Returns the table of Lab values of every 24-bit sRGB color, building it on first use
+## NB the table takes 48 MiB and a few seconds to build, so it only pays off for images converted repeatedly
+# @return (2 ** 24) x 3 uint8 array indexed by (r << 16) | (g << 8) | b
+#
+def get_rgb_to_lab_table():
+    global _rgb_to_lab_table
+    if _rgb_to_lab_table is None:
+        with _build_lock:
+            if _rgb_to_lab_table is None:
+                keys = np.arange(1 << 24, dtype=np.uint32)
+                all_colors = np.stack([keys >> 16, (keys >> 8) & 0xFF, keys & 0xFF], axis=1).astype(np.uint8)
+                _rgb_to_lab_table = rgb_to_lab_pixels(all_colors, out=all_colors)
+    return _rgb_to_lab_table
@@ -5,6 +5,7 @@ import cProfile
 import os
 from K_Means import K_Means
 from k_means_utils import get_timestamp_str
+from lab_cache_utils import LAB_CACHE_DIR
 
 
 def main():
@@ -32,6 +33,9 @@ def main():
     # Prompt user for number of runs
     num_runs = int(input("Enter the number of runs using the specified k value(s): "))
 
+    # Prompt user for number of worker processes to spread runs and k values across
+    num_workers = int(input("Enter the number of worker processes (1 to run serially): "))
+
     # Prompt user to choose whether to create result images that are pixel-replaced
     user_input = input("In addition to resulting palette, also create copy of original image"
                        " in which all pixels are replaced with their representative color? (Y/N): ")
@@ -47,6 +51,36 @@ def main():
         user_input_int = int(input("Enter the % of image dimension to resize to: "))
         resize_level = user_input_int
 
+    # Prompt user to choose whether to fit on a weighted sample of pixels instead of every pixel
+    coreset_size = None
+    user_input = input("Fit palette on a weighted sample of pixels, then label every pixel? (Y/N): ")
+    if user_input.upper() == 'Y':
+        coreset_size = int(input("Enter the number of pixels to sample: "))
+
+    # Prompt user for tiled processing, for images too large to hold in memory
+    tile_size = None
+    if coreset_size is None and num_workers == 1:
+        user_input = input("Process the image in tiles from disk (for images too large for memory)? (Y/N): ")
+        if user_input.upper() == 'Y':
+            tile_size = int(input("Enter the number of pixels per tile: "))
+
+    # Prompt user for caching the decoded image, so sweeps over the same image skip decoding it again
+    lab_cache_dir = None
+    user_input = input(f"Cache the decoded image in {LAB_CACHE_DIR} for later runs on the same image? (Y/N): ")
+    if user_input.upper() == 'Y':
+        lab_cache_dir = LAB_CACHE_DIR
+
+    # Prompt user for a seed, so the runs can be replayed exactly
+    user_input = input("Enter a seed for reproducible runs (leave blank for a random seed): ")
+    seed = int(user_input) if user_input.strip() else None
+
+    # Prompt user for whether to render only the best runs at each k value
+    render_best = None
+    if num_runs > 1:
+        user_input = input("Render result images for only the lowest-SSE runs at each k value? (Y/N): ")
+        if user_input.upper() == 'Y':
+            render_best = int(input("Enter the number of runs to render at each k value: "))
+
     # Create the log file name based on above info
     log_file_name = f"{get_timestamp_str()}__{project_name}_{str(num_runs)}x_"
     if k_option == "S":
@@ -54,7 +88,9 @@ def main():
     elif k_option == "R":
         log_file_name += f"({k_start}_{k_end}_{k_interval})"
 
-    k_means_process = K_Means(project_name, k_values, file_path, num_runs, log_file_name, img_extension, palette_replace, resize_level)
+    k_means_process = K_Means(project_name, k_values, file_path, num_runs, log_file_name, img_extension,
+                              palette_replace, resize_level, num_workers=num_workers, coreset_size=coreset_size,
+                              seed=seed, render_best=render_best, tile_size=tile_size, lab_cache_dir=lab_cache_dir)
     k_means_process.run()
 
 
@@ -1,23 +1,37 @@
 ## Name: Eddie Wu
 ## Description: Module for utility functions used in k-means
 
-import random
 from time import localtime, strftime
 from math import sqrt
+import numpy as np
+from Centroid_Index import Centroid_Index
+
+# Number of pixels per chunk when computing pixel-to-centroid distances with NumPy
+DISTANCE_CHUNK_SIZE = 65536
+# Smallest k, and smallest number of pixels, for which nearest-centroid lookups go through a Centroid_Index
+CENTROID_INDEX_MIN_K = 64
+CENTROID_INDEX_MIN_PIXELS = 4096
+# Default number of sampling rounds for k-means|| seeding
+K_MEANS_PARALLEL_ROUNDS = 5
+# Seeds are below this bound, so they fit a signed 64-bit integer and the binary palette layout
+MAX_SEED = 1 << 63
 
 
 ## Returns k sets of distinct coordinates given specified bounds
 # @param k - number of coordinates to return (int)
 # @param max_x - max x value for coordinates (int)
 # @param max_y - max y value for coordinates (int)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
 # @return list of k distinct (x, y) tuples
-def get_k_random_coords(k, max_x, max_y):
+def get_k_random_coords(k, max_x, max_y, rng=None):
+    if rng is None:
+        rng = get_rng()
     # Initially, use a set to ensure all random coord tuples are distinct # work on making rgb values distinct
     result_set = set()
     # Populate the set until it reaches k size
     while len(result_set) < k:
-        rand_x = random.randint(0, max_x)
-        rand_y = random.randint(0, max_y)
+        rand_x = int(rng.integers(0, max_x, endpoint=True))
+        rand_y = int(rng.integers(0, max_y, endpoint=True))
         result_set.add((rand_x, rand_y))
     # Return result set converted to list
     return list(result_set)
@@ -34,35 +48,39 @@ def map_coords_to_pixels(coords_list, pixel_array):
     return pixels_list
 
 
-## Stringifies a list of RGB tuples for printing or logging
+## Stringifies a list of RGB tuples for printing or logging, floating point values are shown to 2 decimal places
 # @param pixels_list - list of RGB tuples
 # @return stringified list
 def stringify_tuple_list(pixels_list):
-    return '  '.join([str(t) for t in pixels_list])
+    return '  '.join([str(tuple(round(value, 2) if isinstance(value, float) else value for value in t))
+                      for t in pixels_list])
 
 
 ## Places pixels from source array into appropriate cluster based on k_colors
-# @param pixels_with_coords - list of pixels with coords ((x, y), (r, g, b))
+# @param pixels - N x 3 array of pixel values
 # @param k_colors - current representative pixels (list of RGB tuples, length k)
-# @param k_clusters - current clusters of pixels (list of lists, each inner list is list of RGB tuples)
+# @param labels - array of N cluster indices, updated in place
 #
-def group_pixels(pixels_with_coords, k_colors, k_clusters):
+def group_pixels(pixels, k_colors, labels):
+    # Build the nearest-centroid index once for this pass if k is large enough to benefit
+    centroid_index = get_centroid_index(k_colors, len(pixels))
     # Iterate over pixels
-    for i in range(len(pixels_with_coords)):
-        curr_pixel_with_coords = pixels_with_coords[i]
-        curr_pixel = curr_pixel_with_coords[1]
+    for i in range(len(pixels)):
+        curr_pixel = tuple(pixels[i].tolist())
         # Get the cluster index for current pixel based on min. squared Euclidean distance
-        cluster_idx = get_cluster_id(curr_pixel, k_colors)
-        # Place the pixel in the corresponding cluster
-        k_clusters[cluster_idx].append(curr_pixel_with_coords)
+        # and label the pixel with the corresponding cluster
+        labels[i] = get_cluster_id(curr_pixel, k_colors, centroid_index)
 
 
 ## Determine the closest representative color to a given pixel
 # @param pixel - RGB values to compare against k_colors (list of RGB tuples)
 # @param k_colors - current representative pixels (list of RGB tuples, length k)
+# @param centroid_index - optional Centroid_Index built from k_colors, used instead of scanning every color
 # @return index of color in k_colors list that is closest to current pixel (int)
 #
-def get_cluster_id(pixel, k_colors):
+def get_cluster_id(pixel, k_colors, centroid_index=None):
+    if centroid_index is not None:
+        return centroid_index.nearest(pixel)[0]
     # Variables to track min distance and index of min
     idx_of_closest = -1
     min_distance = float("inf")
@@ -90,14 +108,30 @@ def get_sq_euclidean_dist(pixel1, pixel2):
 
 
 ## Calculate the average color in each of k clusters
-# @param k_clusters - clusters of pixels with coords (list of k lists, each list contains ((x, y), (r, g, b))
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices
+# @param k - number of clusters
+# @param empty_colors - optional list of k tuples, an empty cluster keeps its color from here instead of raising
 # @return list of k RGB tuples
 #
-def update_k_colors(k_clusters):
+def update_k_colors(pixels, labels, k, empty_colors=None):
+    # Accumulate pixel count and channel sums of each cluster
+    counts = [0] * k
+    sums = [[0, 0, 0] for _ in range(k)]
+    for i in range(len(pixels)):
+        label = int(labels[i])
+        curr_pixel = pixels[i].tolist()
+        counts[label] += 1
+        for channel in range(3):
+            sums[label][channel] += curr_pixel[channel]
     result_k_colors = []
-    for i in range(len(k_clusters)):
-        curr_cluster = k_clusters[i]
-        result_k_colors.append(get_average_pixel(curr_cluster))
+    for i in range(k):
+        if counts[i] == 0:
+            if empty_colors is None:
+                raise ZeroDivisionError("Cluster contains 0 pixels")
+            result_k_colors.append(tuple(empty_colors[i]))
+            continue
+        result_k_colors.append(tuple(channel_sum / counts[i] for channel_sum in sums[i]))
     return result_k_colors
 
 
@@ -142,22 +176,56 @@ def compare_tuple_lists(list_1, list_2):
     return True
 
 
+## Returns the largest distance any centroid moved between two lists of centroids
+# @param list_1 - first list of tuples
+# @param list_2 - second list of tuples, same length as list_1
+# @return max Euclidean distance between corresponding tuples (float)
+#
+def get_max_shift(list_1, list_2):
+    return max(sqrt(get_sq_euclidean_dist(list_1[i], list_2[i])) for i in range(len(list_1)))
+
+
+## Rounds floating point centroids to pixel values
+# @param k_colors - list of tuples of floats
+# @return list of tuples of three ints
+#
+def get_rounded_colors(k_colors):
+    return [tuple(round(value) for value in color) for color in k_colors]
+
+
 ## Function to calculate total SSE (sum of squared errors) for the resulting clusters of a given k
 # @param k_colors - the resulting representative k_colors (centroids)
-# @param k_clusters - list of lists, where each list is a cluster of (coords, pixel) tuples
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param chunk_size - number of pixels to process at a time
 # @return sum of squared errors (squared Euclidean distances) between all pixels and their respective centroids
 #
-def get_total_SSE(k_colors, k_clusters):
-    total_SSE = 0
-    for i in range(len(k_colors)):
-        centroid_pixel = k_colors[i]
-        pixel_cluster = k_clusters[i]
-        # Each pixel has format ((x, y), (r, g, b)) so need to use the RGB part
-        for pixel in pixel_cluster:
-            total_SSE += get_sq_euclidean_dist(centroid_pixel, pixel[1])
+def get_total_SSE(k_colors, pixels, labels, weights=None, chunk_size=DISTANCE_CHUNK_SIZE):
+    total_SSE = 0.0
+    for start, stop, sq_dists in get_label_sq_dists(k_colors, pixels, labels, chunk_size):
+        if weights is not None:
+            sq_dists *= weights[start:stop]
+        total_SSE += float(sq_dists.sum())
     return total_SSE
 
 
+## Computes the squared distance of each pixel to the centroid it is labelled with, one chunk at a time
+# @param k_colors - the representative k_colors (centroids)
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors
+# @param chunk_size - number of pixels to process at a time
+# @return iterator of (start, stop, array of squared distances of pixels[start:stop]) tuples
+#
+def get_label_sq_dists(k_colors, pixels, labels, chunk_size=DISTANCE_CHUNK_SIZE):
+    centroids = np.asarray(k_colors, dtype=np.float64)
+    for start in range(0, len(pixels), chunk_size):
+        stop = min(start + chunk_size, len(pixels))
+        # Look up each pixel's centroid through its label
+        diffs = pixels[start:stop].astype(np.float64) - centroids[labels[start:stop]]
+        yield start, stop, np.einsum('ij,ij->i', diffs, diffs)
+
+
 ## Function to generate a sortable timestamp string
 # @return timestamp string in format yy/mm/dd h:m:s
 #
@@ -176,3 +244,520 @@ def get_weight(centroids, pixel):
         if distance < min_distance:
             min_distance = distance
     return min_distance
+
+
+## Builds a nearest-centroid index when k is large enough for it to beat a linear scan over k_colors
+# @param k_colors - current representative pixels (list of tuples, length k)
+# @param num_pixels - number of pixels that will be looked up against the index (int)
+# @return Centroid_Index, or None if a linear scan is cheaper
+#
+def get_centroid_index(k_colors, num_pixels):
+    if len(k_colors) < CENTROID_INDEX_MIN_K or num_pixels < CENTROID_INDEX_MIN_PIXELS:
+        return None
+    return Centroid_Index(k_colors)
+
+
+## Converts a PIL LAB image into a compact N x 3 array of pixels in row-major order
+## NB PIL stores a and b as signed bytes internally but PixelAccess reports them offset by 128, so do the same here
+# @param lab_img - PIL image in LAB mode
+# @return contiguous N x 3 uint8 array, where the pixel at (x, y) is at index y * width + x
+#
+def get_lab_pixel_array(lab_img):
+    pixels = np.array(lab_img, dtype=np.uint8).reshape(-1, 3)
+    pixels[:, 1:] ^= 128
+    return pixels
+
+
+## Returns the smallest unsigned integer type able to hold labels for k clusters
+# @param k - number of clusters
+# @return NumPy dtype for a label array
+#
+def get_label_dtype(k):
+    if k <= 1 << 8:
+        return np.uint8
+    elif k <= 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+## Packs each 8-bit pixel into a single int so colors can be compared and sorted as scalars
+# @param pixels - N x 3 uint8 array of pixel values
+# @return array of N uint32 keys
+#
+def get_color_keys(pixels):
+    return ((pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8)
+            | pixels[:, 2].astype(np.uint32))
+
+
+## Collapses pixels into their unique colors and the number of pixels of each color
+# @param pixels - N x 3 uint8 array of pixel values
+# @return tuple of (sorted array of M color keys, M x 3 uint8 array of unique colors, array of M int64 counts)
+#
+def get_unique_colors(pixels):
+    unique_keys, counts = np.unique(get_color_keys(pixels), return_counts=True)
+    unique_colors = np.stack([(unique_keys >> 16) & 0xFF, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF],
+                             axis=1).astype(np.uint8)
+    return unique_keys, unique_colors, counts.astype(np.int64)
+
+
+## Maps labels of unique colors back onto every pixel of the image
+# @param pixels - N x 3 uint8 array of pixel values
+# @param unique_keys - sorted array of M color keys from get_unique_colors
+# @param unique_labels - array of M cluster indices, one per unique color
+# @param chunk_size - number of pixels to process at a time
+# @return array of N cluster indices
+#
+def expand_unique_labels(pixels, unique_keys, unique_labels, chunk_size=DISTANCE_CHUNK_SIZE):
+    labels = np.empty(len(pixels), dtype=unique_labels.dtype)
+    for start in range(0, len(pixels), chunk_size):
+        stop = min(start + chunk_size, len(pixels))
+        # Every pixel's key is present in unique_keys, so searchsorted finds its exact position
+        unique_idx = np.searchsorted(unique_keys, get_color_keys(pixels[start:stop]))
+        labels[start:stop] = unique_labels[unique_idx]
+    return labels
+
+
+## Builds downscaled copies of an image by repeatedly averaging 2 x 2 blocks of pixels
+## NB an odd last row or column is dropped at each level, which does not matter for seeding
+# @param pixels - N x 3 array of pixel values, pixel (x, y) at index y * width + x
+# @param width - width of image (int)
+# @param height - height of image (int)
+# @param num_levels - number of pyramid levels including the full-size image (int)
+# @return list of up to num_levels - 1 uint8 pixel arrays, coarsest first, excluding the full-size image
+#
+def get_pyramid_levels(pixels, width, height, num_levels):
+    levels = []
+    image = pixels.reshape(height, width, 3).astype(np.float64)
+    for _ in range(num_levels - 1):
+        height, width = height // 2, width // 2
+        if height == 0 or width == 0:
+            break
+        image = image[:2 * height, :2 * width].reshape(height, 2, width, 2, 3).mean(axis=(1, 3))
+        levels.append(np.rint(image).astype(np.uint8).reshape(-1, 3))
+    return levels[::-1]
+
+
+## Calculates the squared Euclidean distance between every pixel and every centroid
+# @param pixels - N x 3 array of pixel values
+# @param k_colors - current representative pixels (list of tuples or k x 3 array)
+# @return N x k float array of squared distances
+#
+def get_sq_dists_np(pixels, k_colors):
+    pixels = np.asarray(pixels, dtype=np.float64)
+    centroids = np.asarray(k_colors, dtype=np.float64)
+    # Expand |p - c|^2 = |p|^2 - 2p.c + |c|^2 so the bulk of the work is a single matrix product
+    sq_dists = (np.einsum('ij,ij->i', pixels, pixels)[:, np.newaxis]
+                - 2 * pixels @ centroids.T
+                + np.einsum('ij,ij->i', centroids, centroids)[np.newaxis, :])
+    # Guard against tiny negative values from floating point cancellation
+    return np.maximum(sq_dists, 0, out=sq_dists)
+
+
+## Vectorized equivalent of group_pixels: labels each pixel with the index of its closest centroid
+# @param pixels - N x 3 array of pixel values
+# @param k_colors - current representative pixels (list of tuples, length k)
+# @param labels - optional array of N cluster indices to write into, a new array is created if not given
+# @param chunk_size - number of pixels to process at a time, bounds temporary memory to chunk_size x k
+# @return array of N cluster indices
+#
+def get_labels_np(pixels, k_colors, labels=None, chunk_size=DISTANCE_CHUNK_SIZE):
+    num_pixels = len(pixels)
+    if labels is None:
+        labels = np.empty(num_pixels, dtype=get_label_dtype(len(k_colors)))
+    centroid_index = get_centroid_index(k_colors, num_pixels)
+    if centroid_index is not None:
+        return centroid_index.query(pixels, labels, chunk_size)[0]
+    for start in range(0, num_pixels, chunk_size):
+        stop = min(start + chunk_size, num_pixels)
+        # argmin returns the first index on ties, matching get_cluster_id
+        labels[start:stop] = np.argmin(get_sq_dists_np(pixels[start:stop], k_colors), axis=1)
+    return labels
+
+
+## Vectorized equivalent of update_k_colors: average color of each cluster given a label array
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices
+# @param k - number of clusters
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param empty_colors - optional list of k tuples, an empty cluster keeps its color from here instead of raising
+# @return list of k tuples of three floats
+#
+def update_k_colors_np(pixels, labels, k, weights=None, empty_colors=None):
+    counts = np.bincount(labels, weights=weights, minlength=k)
+    empty = counts == 0
+    if np.any(empty) and empty_colors is None:
+        raise ZeroDivisionError("Cluster contains 0 pixels")
+    # Sum each channel separately per cluster, then divide by cluster size
+    channel_sums = []
+    for channel in range(3):
+        channel_values = pixels[:, channel] if weights is None else pixels[:, channel] * weights
+        channel_sums.append(np.bincount(labels, weights=channel_values, minlength=k))
+    averages = np.stack(channel_sums, axis=1) / np.where(empty, 1, counts)[:, np.newaxis]
+    if np.any(empty):
+        averages[empty] = np.asarray(empty_colors, dtype=np.float64)[empty]
+    return [tuple(color) for color in averages.tolist()]
+
+
+## Vectorized equivalent of get_weight: squared distance from each pixel to its nearest centroid
+# @param pixels - N x 3 array of pixel values
+# @param centroids - list of tuples (centroids chosen so far)
+# @param chunk_size - number of pixels to process at a time
+# @return array of N squared distances
+#
+def get_weights_np(pixels, centroids, chunk_size=DISTANCE_CHUNK_SIZE):
+    num_pixels = len(pixels)
+    centroid_index = get_centroid_index(centroids, num_pixels)
+    if centroid_index is not None:
+        return centroid_index.query(pixels, chunk_size=chunk_size)[1]
+    weights = np.empty(num_pixels, dtype=np.float64)
+    for start in range(0, num_pixels, chunk_size):
+        stop = min(start + chunk_size, num_pixels)
+        weights[start:stop] = np.min(get_sq_dists_np(pixels[start:stop], centroids), axis=1)
+    return weights
+
+
+## Creates a random generator for an independent stream derived from a base seed and stream keys, so each
+## stream can be replayed on its own; nothing is drawn from the shared random module state
+# @param seed - base seed (int), None for a fresh unpredictable stream
+# @param stream_keys - ints identifying the stream, e.g. (run number, k); no keys gives the base stream
+# @return numpy.random.Generator
+#
+def get_rng(seed=None, *stream_keys):
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=stream_keys))
+
+
+## Draws an index with probability proportional to its weight, in the same way as random.choices
+# @param weights - array of non-negative weights
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return index of the chosen weight (int)
+#
+def choose_weighted_index(weights, rng=None):
+    if rng is None:
+        rng = get_rng()
+    cum_weights = np.cumsum(weights)
+    total = float(cum_weights[-1])
+    # Fall back to a uniform pick when every weight is zero (e.g. all pixels coincide with centroids)
+    if total <= 0:
+        return int(rng.random() * len(weights))
+    return int(np.searchsorted(cum_weights, rng.random() * total, side='right'))
+
+
+## Draws random indices of points, in proportion to their weights if given
+# @param num_points - number of points to draw from (int)
+# @param size - number of indices to draw, with replacement (int)
+# @param weights - optional array of point weights (e.g. pixel counts of unique colors)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return array of size indices
+#
+def sample_indices(num_points, size, weights=None, rng=None):
+    if rng is None:
+        rng = get_rng()
+    if weights is None:
+        return rng.integers(0, num_points, size=size)
+    cum_weights = np.cumsum(weights)
+    return np.searchsorted(cum_weights, rng.random(size) * cum_weights[-1], side='right')
+
+
+## Draws a lightweight coreset: half of the sampling probability is spread evenly, half goes to points in
+## proportion to their squared distance from the mean, and each drawn point is weighted by its inverse probability
+## so the weighted SSE of any centroids on the coreset estimates their SSE on all points
+## NB points drawn more than once are merged, so the coreset can hold fewer than size points
+# @param points - N x 3 array of points
+# @param size - number of points to draw, with replacement (int)
+# @param point_weights - optional array of point weights (e.g. pixel counts of unique colors)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return tuple of (M x 3 array of coreset points, array of M float weights)
+#
+def get_lightweight_coreset(points, size, point_weights=None, rng=None):
+    weights = np.ones(len(points)) if point_weights is None else np.asarray(point_weights, dtype=np.float64)
+    total_weight = weights.sum()
+    mean = np.asarray(points, dtype=np.float64).T @ weights / total_weight
+    distance_weights = weights * get_weights_np(points, [tuple(mean.tolist())])
+    probabilities = weights / total_weight
+    # Without any spread every point is the mean, so sampling stays even
+    if distance_weights.sum() > 0:
+        probabilities = (probabilities + distance_weights / distance_weights.sum()) / 2
+    sample_idx, num_draws = np.unique(sample_indices(len(points), size, probabilities, rng), return_counts=True)
+    coreset_weights = num_draws * weights[sample_idx] / (size * probabilities[sample_idx])
+    return points[sample_idx], coreset_weights
+
+
+## Moves centroids toward the mean of their pixels in a batch, with a learning rate per centroid
+## NB each centroid becomes the running mean of every pixel it has absorbed, i.e. learning rate 1 / count
+# @param centroids - k x 3 float array of centroids, updated in place
+# @param centroid_counts - array of k counts of pixels absorbed so far, updated in place
+# @param batch - B x 3 array of pixel values
+# @param batch_labels - array of B cluster indices for the batch
+#
+def update_mini_batch_centroids(centroids, centroid_counts, batch, batch_labels):
+    k = len(centroids)
+    batch_counts = np.bincount(batch_labels, minlength=k)
+    batch_sums = np.stack([np.bincount(batch_labels, weights=batch[:, channel], minlength=k)
+                           for channel in range(3)], axis=1)
+    centroid_counts += batch_counts
+    updated = batch_counts > 0
+    learning_rates = batch_counts[updated] / centroid_counts[updated]
+    batch_means = batch_sums[updated] / batch_counts[updated, np.newaxis]
+    centroids[updated] += learning_rates[:, np.newaxis] * (batch_means - centroids[updated])
+
+
+## Picks k initial centroids with k-means++, updating each point's nearest-center distance only against the
+## newly added center so seeding is O(n * k)
+# @param points - N x 3 array of pixel values
+# @param k - number of centroids to pick (int)
+# @param point_weights - optional array of N point weights (e.g. pixel counts of unique colors)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return list of k tuples
+#
+def get_k_means_plus_plus_centroids(points, k, point_weights=None, rng=None):
+    if point_weights is None:
+        point_weights = np.ones(len(points))
+    if rng is None:
+        rng = get_rng()
+    # Initially select one point at random (weighted points are picked in proportion to their weights)
+    first_idx = choose_weighted_index(point_weights, rng)
+    return add_k_means_plus_plus_centroids(points, [tuple(points[first_idx].tolist())], k - 1, point_weights, rng)
+
+
+## Adds centroids to an existing set with k-means++ picks, i.e. from the residual not yet covered by the set
+# @param points - N x 3 array of pixel values
+# @param centroids - list of tuples chosen so far
+# @param num_new - number of centroids to add (int)
+# @param point_weights - optional array of N point weights (e.g. pixel counts of unique colors)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return list of len(centroids) + num_new tuples
+#
+def add_k_means_plus_plus_centroids(points, centroids, num_new, point_weights=None, rng=None):
+    if point_weights is None:
+        point_weights = np.ones(len(points))
+    if rng is None:
+        rng = get_rng()
+    centroids = list(centroids)
+    target = len(centroids) + num_new
+    sq_dists = get_weights_np(points, centroids)
+    # While not enough have been chosen, choose next center weighted by sq dist to nearest selected center
+    while len(centroids) < target:
+        next_idx = choose_weighted_index(sq_dists * point_weights, rng)
+        centroids.append(tuple(points[next_idx].tolist()))
+        np.minimum(sq_dists, get_weights_np(points, centroids[-1:]), out=sq_dists)
+    return centroids
+
+
+## Picks k initial centroids with k-means|| (scalable k-means++): each round samples many candidates at once in
+## proportion to their distance from the current candidates, then the weighted candidates are reclustered
+## into k centroids with k-means++
+# @param points - N x 3 array of pixel values
+# @param k - number of centroids to pick (int)
+# @param point_weights - optional array of N point weights (e.g. pixel counts of unique colors)
+# @param rounds - number of sampling rounds (int)
+# @param oversampling - expected number of candidates added per round, defaults to 2k
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return list of k tuples
+#
+def get_k_means_parallel_centroids(points, k, point_weights=None, rounds=K_MEANS_PARALLEL_ROUNDS,
+                                   oversampling=None, rng=None):
+    if oversampling is None:
+        oversampling = 2 * k
+    if point_weights is None:
+        point_weights = np.ones(len(points))
+    if rng is None:
+        rng = get_rng()
+    first_idx = choose_weighted_index(point_weights, rng)
+    candidates = points[first_idx:first_idx + 1]
+    sq_dists = get_weights_np(points, candidates)
+    for _ in range(rounds):
+        cost = float(np.dot(sq_dists, point_weights))
+        if cost <= 0:
+            break
+        # Sample every point independently, with probability proportional to its share of the current cost
+        probabilities = np.minimum(1.0, oversampling * sq_dists * point_weights / cost)
+        new_candidates = points[rng.random(len(points)) < probabilities]
+        if len(new_candidates) == 0:
+            continue
+        candidates = np.concatenate([candidates, new_candidates])
+        np.minimum(sq_dists, get_weights_np(points, new_candidates), out=sq_dists)
+
+    # Too few distinct candidates to recluster (e.g. very few colors), so fall back to plain k-means++
+    if len(candidates) < k:
+        return get_k_means_plus_plus_centroids(points, k, point_weights, rng)
+    # Weight each candidate by how many pixels it is closest to, then recluster the candidates into k centroids
+    candidate_weights = np.bincount(get_labels_np(points, candidates), weights=point_weights,
+                                    minlength=len(candidates))
+    return get_k_means_plus_plus_centroids(candidates, k, candidate_weights, rng)
+
+
+## Function to calculate the SSE (sum of squared errors) of each cluster
+# @param k_colors - the representative k_colors (centroids)
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param chunk_size - number of pixels to process at a time
+# @return array of k SSE values
+#
+def get_cluster_SSEs(k_colors, pixels, labels, weights=None, chunk_size=DISTANCE_CHUNK_SIZE):
+    cluster_SSEs = np.zeros(len(k_colors))
+    for start, stop, sq_dists in get_label_sq_dists(k_colors, pixels, labels, chunk_size):
+        if weights is not None:
+            sq_dists *= weights[start:stop]
+        cluster_SSEs += np.bincount(labels[start:stop], weights=sq_dists, minlength=len(k_colors))
+    return cluster_SSEs
+
+
+## Accumulates the weight, sum and scatter (sum of outer products) of a subset of pixels, one chunk at a time
+# @param pixels - N x 3 array of pixel values
+# @param members - array of indices of the pixels in the subset
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param chunk_size - number of pixels to process at a time
+# @return tuple of (total weight, 3-vector of weighted sums, 3 x 3 weighted scatter matrix)
+#
+def get_cluster_moments(pixels, members, weights=None, chunk_size=DISTANCE_CHUNK_SIZE):
+    total_weight, sums, scatter = 0.0, np.zeros(3), np.zeros((3, 3))
+    for start in range(0, len(members), chunk_size):
+        chunk_members = members[start:start + chunk_size]
+        chunk = pixels[chunk_members].astype(np.float64)
+        chunk_weights = np.ones(len(chunk)) if weights is None else weights[chunk_members].astype(np.float64)
+        total_weight += float(chunk_weights.sum())
+        sums += chunk_weights @ chunk
+        scatter += (chunk * chunk_weights[:, np.newaxis]).T @ chunk
+    return total_weight, sums, scatter
+
+
+## Finds the pixels farthest from the centroids they are labelled with, one chunk at a time
+# @param k_colors - the representative k_colors (centroids)
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors
+# @param num_farthest - number of pixels to find (int)
+# @param chunk_size - number of pixels to process at a time
+# @return tuple of (indices, squared distances) of the farthest pixels in descending order of distance, ties going
+#         to the lower index
+#
+def get_farthest_pixels(k_colors, pixels, labels, num_farthest, chunk_size=DISTANCE_CHUNK_SIZE):
+    farthest_idx, farthest_sq_dists = np.empty(0, dtype=np.intp), np.empty(0)
+    for start, stop, sq_dists in get_label_sq_dists(k_colors, pixels, labels, chunk_size):
+        chunk_idx = np.argsort(-sq_dists, kind='stable')[:num_farthest]
+        # Earlier indices come first in the merged arrays, so the stable sort keeps them ahead of equal distances
+        merged_idx = np.concatenate([farthest_idx, chunk_idx + start])
+        merged_sq_dists = np.concatenate([farthest_sq_dists, sq_dists[chunk_idx]])
+        order = np.argsort(-merged_sq_dists, kind='stable')[:num_farthest]
+        farthest_idx, farthest_sq_dists = merged_idx[order], merged_sq_dists[order]
+    return farthest_idx, farthest_sq_dists
+
+
+## Finds the direction of greatest spread of a set of pixels
+# @param pixels - M x 3 array of pixel values
+# @param weights - optional array of M pixel counts, None if every pixel counts once
+# @return tuple of (variance along the direction, unit 3-vector), variance is 0 if the pixels cannot be split
+#
+def get_principal_axis(pixels, weights=None):
+    if len(pixels) < 2:
+        return 0.0, None
+    covariance = np.atleast_2d(np.cov(pixels.astype(np.float64), rowvar=False, bias=True, aweights=weights))
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    return max(float(eigenvalues[-1]), 0.0), eigenvectors[:, -1]
+
+
+## Splits the highest-SSE clusters in two along their direction of greatest spread
+## NB clusters of a single color cannot be split, so any shortfall is made up with k-means++ picks
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors
+# @param k_colors - the representative k_colors (centroids)
+# @param num_new - number of centroids to add (int)
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param rng - optional numpy.random.Generator for the k-means++ picks, a fresh one if None
+# @return list of len(k_colors) + num_new tuples
+#
+def split_clusters(pixels, labels, k_colors, num_new, weights=None, rng=None):
+    centroids = [tuple(color) for color in k_colors]
+    cluster_SSEs = get_cluster_SSEs(k_colors, pixels, labels, weights)
+    for cluster_idx in np.argsort(cluster_SSEs)[::-1][:num_new].tolist():
+        members = labels == cluster_idx
+        variance, axis = get_principal_axis(pixels[members], None if weights is None else weights[members])
+        if variance <= 0:
+            continue
+        # Move the old centroid one standard deviation down the principal axis and add one the same distance up
+        offset = np.sqrt(variance) * axis
+        center = np.asarray(k_colors[cluster_idx], dtype=np.float64)
+        centroids[cluster_idx] = tuple(np.clip(center - offset, 0, 255).tolist())
+        centroids.append(tuple(np.clip(center + offset, 0, 255).tolist()))
+    return add_k_means_plus_plus_centroids(pixels, centroids, len(k_colors) + num_new - len(centroids), weights,
+                                           rng)
+
+
+## Gives every empty cluster some pixels again by relabelling them, so the next centroid update has a mean for it
+## 'farthest' moves the pixel farthest from its centroid into the empty cluster; 'split' moves the half of the
+## highest-SSE cluster of more than one color that lies above its mean along its direction of greatest spread,
+## falling back to 'farthest' once no cluster can be split
+## NB clusters stay empty if every pixel already sits on its centroid, i.e. there are fewer colors than clusters
+# @param pixels - N x 3 array of pixel values
+# @param labels - array of N cluster indices into k_colors, updated in place
+# @param k_colors - the representative k_colors (centroids) the labels were assigned against
+# @param weights - optional array of N pixel counts (e.g. for unique colors), None if every pixel counts once
+# @param method - 'farthest' or 'split'
+# @return number of empty clusters that were re-seeded (int)
+#
+def reseed_empty_clusters(pixels, labels, k_colors, weights=None, method='farthest'):
+    k = len(k_colors)
+    empty_clusters = np.flatnonzero(np.bincount(labels, minlength=k) == 0).tolist()
+    if not empty_clusters:
+        return 0
+    centroids = np.asarray(k_colors, dtype=np.float64)
+    num_reseeded = 0
+    if method == 'split':
+        # SSEs are computed once and updated as clusters are split; member indices are found once per donor
+        cluster_SSEs = get_cluster_SSEs(centroids, pixels, labels, weights)
+        cluster_members = {}
+        # SSE is against the centroid the labels were assigned to, so a cluster of one color can have positive SSE
+        ## but no spread to split along
+        unsplittable = set()
+        unsplit_clusters = []
+        for cluster_idx in empty_clusters:
+            is_split = False
+            for donor_idx in np.argsort(cluster_SSEs)[::-1].tolist():
+                if cluster_SSEs[donor_idx] <= 0:
+                    break
+                if donor_idx in unsplittable:
+                    continue
+                if donor_idx not in cluster_members:
+                    cluster_members[donor_idx] = np.flatnonzero(labels == donor_idx)
+                members = cluster_members[donor_idx]
+                total_weight, sums, scatter = get_cluster_moments(pixels, members, weights)
+                center = sums / total_weight
+                eigenvalues, eigenvectors = np.linalg.eigh(scatter / total_weight - np.outer(center, center))
+                if eigenvalues[-1] <= 0:
+                    unsplittable.add(donor_idx)
+                    continue
+                sides = np.concatenate([(pixels[members[start:start + DISTANCE_CHUNK_SIZE]] - center)
+                                        @ eigenvectors[:, -1] > 0
+                                        for start in range(0, len(members), DISTANCE_CHUNK_SIZE)])
+                num_moved = np.count_nonzero(sides)
+                if num_moved == 0 or num_moved == len(members):
+                    unsplittable.add(donor_idx)
+                    continue
+                moved = members[sides]
+                labels[moved] = cluster_idx
+                cluster_members[donor_idx], cluster_members[cluster_idx] = members[~sides], moved
+                # Both halves get new means on the next update, until then score them against their own means
+                moved_moments = get_cluster_moments(pixels, moved, weights)
+                donor_moments = (total_weight - moved_moments[0], sums - moved_moments[1], scatter - moved_moments[2])
+                for idx, (weight, idx_sums, idx_scatter) in ((donor_idx, donor_moments), (cluster_idx, moved_moments)):
+                    centroids[idx] = idx_sums / weight
+                    # SSE about the mean is the trace of the scatter less the weight times the squared mean
+                    cluster_SSEs[idx] = max(float(np.trace(idx_scatter) - weight * centroids[idx] @ centroids[idx]),
+                                            0.0)
+                is_split = True
+                break
+            if is_split:
+                num_reseeded += 1
+            else:
+                unsplit_clusters.append(cluster_idx)
+        empty_clusters = unsplit_clusters
+    if empty_clusters:
+        farthest_idx, farthest_sq_dists = get_farthest_pixels(centroids, pixels, labels, len(empty_clusters))
+        for cluster_idx, pixel_idx, sq_dist in zip(empty_clusters, farthest_idx.tolist(), farthest_sq_dists):
+            if sq_dist <= 0:
+                break
+            labels[pixel_idx] = cluster_idx
+            num_reseeded += 1
+    return num_reseeded
@@ -0,0 +1,61 @@
+## Name: Eddie Wu
+## Description: Helper functions for caching an image's decoded, resized Lab pixels on disk as memory-mappable .npy
+##              files, so repeated runs on the same image skip decoding, resizing and color conversion
+
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+# Default location of cached Lab pixel files
+LAB_CACHE_DIR = "./cache/lab"
+# Size of the chunks the source file is hashed in
+HASH_CHUNK_SIZE = 1 << 20
+
+
+## Returns the path of the cached Lab pixels of an image file at a resize level
+## NB the file is read (not decoded) to hash its contents, so an edited file never hits a stale entry
+# @param file_path - path of the source image
+# @param resize_level - int % the image is resized to
+# @param cache_dir - directory of the cached files
+# @return path string of a .npy file, which may not exist yet
+#
+def get_lab_cache_path(file_path, resize_level, cache_dir=LAB_CACHE_DIR):
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as src_file:
+        for chunk in iter(lambda: src_file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    mtime = os.stat(file_path).st_mtime_ns
+    key = hashlib.sha256(f"{file_hash.hexdigest()}|{mtime}|{resize_level}".encode()).hexdigest()
+    return os.path.join(cache_dir, key + ".npy")
+
+
+## Maps cached Lab pixels from disk without reading them in
+# @param cache_path - path from get_lab_cache_path
+# @return tuple of (read-only N x 3 memmap of Lab pixels, image width, image height), None if not cached
+#
+def load_lab_pixels(cache_path):
+    try:
+        pixels = np.load(cache_path, mmap_mode='r')
+    except (OSError, ValueError):
+        # Missing, or left unreadable by an interrupted write
+        return None
+    if pixels.ndim != 3 or pixels.shape[2] != 3 or pixels.dtype != np.uint8:
+        return None
+    img_height, img_width = pixels.shape[:2]
+    return pixels.reshape(-1, 3), img_width, img_height
+
+
+## Saves Lab pixels to the cache, kept as height x width x 3 so the file records the image size
+## NB written under a temporary name first, so concurrent runs never map a partial file
+# @param cache_path - path from get_lab_cache_path
+# @param pixels - N x 3 uint8 array of Lab values, pixel (x, y) at index y * width + x
+# @param img_width - width of image
+# @param img_height - height of image
+#
+def save_lab_pixels(cache_path, pixels, img_width, img_height):
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, prefix='.', suffix=".npy", delete=False) as tmp_file:
+        np.save(tmp_file, np.asarray(pixels).reshape(img_height, img_width, 3))
+    os.replace(tmp_file.name, cache_path)
@@ -1,7 +1,33 @@
 ## Name: Eddie Wu
 ## Description: Module for functions related to palette image creation
 
-from PIL import Image, ImageCms
+from PIL import Image, ImageFilter, ImageOps
+import numpy as np
+import color_utils
+import k_means_utils
+
+# Number of grid points along each channel of exported 3D LUTs (.cube files commonly use 17, 33 or 65)
+LUT_SIZE = 33
+# How far above the target size images are first shrunk by whole factors before resampling when resizing
+## (3 is close to indistinguishable from a full resample)
+RESIZE_REDUCING_GAP = 3.0
+
+
+## Opens an image at a percentage of its dimensions, upright according to its EXIF orientation
+## JPEGs are decoded straight at the smallest DCT scale (1/2, 1/4 or 1/8) still at least the target size, so decode
+## time and memory drop with the square of the scale; resizing before rotating gives the same dimensions
+# @param img - PIL image opened from a file and not yet loaded
+# @param resize_level - % of the image dimensions to resize to
+# @return PIL image
+#
+def get_resized_image(img, resize_level):
+    if resize_level < 100:
+        resize_fraction = resize_level / 100
+        target_size = (round(img.width * resize_fraction), round(img.height * resize_fraction))
+        # Only changes how JPEGs are decoded, other formats ignore it
+        img.draft("RGB", target_size)
+        img = img.resize(target_size, reducing_gap=RESIZE_REDUCING_GAP)
+    return ImageOps.exif_transpose(img)
 
 
 ## Creates basic palette bands image
@@ -33,87 +59,87 @@ def create_basic_palette(k_colors):
     return img
 
 
+# Layout of appended palettes: white gap of 25 px between image and palette, palette section 1/2 of the shorter
+## image dimension, minimum 50 px
+PALETTE_GAP = 25
+MIN_PALETTE_DIMENSION = 50
+
+
+## Lays out the canvas of an appended palette: the palette section goes beside a portrait image and below a
+## landscape one
+# @param img_width - width of original image
+# @param img_height - height of original image
+# @return tuple of (canvas width, canvas height, orientation 'P' or 'L', x or y where the palette section starts)
+#
+def get_palette_layout(img_width, img_height):
+    canvas_width, canvas_height = img_width, img_height
+    shorter_dimension = min(img_width, img_height)
+    if canvas_width == shorter_dimension:
+        canvas_width = canvas_width + PALETTE_GAP + max(MIN_PALETTE_DIMENSION, round(shorter_dimension / 2))
+        return canvas_width, canvas_height, 'P', img_width + PALETTE_GAP - 1
+    canvas_height = canvas_height + PALETTE_GAP + max(MIN_PALETTE_DIMENSION, round(shorter_dimension / 2))
+    return canvas_width, canvas_height, 'L', img_height + PALETTE_GAP - 1
+
+
+## Colors the palette section pixel by pixel along its length, one band per cluster in proportion to its size,
+## largest first (equal sizes keep their cluster order)
+# @param k_colors - list of k Lab tuples of ints
+# @param cluster_sizes - array of k cluster sizes
+# @param length - length of the palette section in pixels
+# @return length x 3 uint8 array of colors
+#
+def get_band_colors(k_colors, cluster_sizes, length):
+    band_order = np.argsort(-cluster_sizes, kind='stable')
+    # Map cluster sizes to proportional band boundaries in pixels, so the bands always cover the full length
+    band_ends = np.rint(np.cumsum(cluster_sizes[band_order]) / cluster_sizes.sum() * length).astype(int)
+    return np.repeat(np.asarray(k_colors, dtype=np.uint8)[band_order], np.diff(band_ends, prepend=0), axis=0)
+
+
 ## Creates copy of the original image with proportional palette bands appended
-# @param src_image_array - image array for original image
+# @param src_img - PIL image of original image
 # @param mode - mode of original image (used to make copy)
 # @param img_width - width of original image
 # @param img_height - height of original image
 # @param k_colors - resulting k_colors from k-means clustering (list of RGB tuples)
-# @param k_clusters - resulting k_clusters for each representative color (used for proportional palette bands)
+# @param labels - array of cluster indices for each pixel (used for proportional palette bands)
 # @return PIL image object of a png with vertical bands, one for each k_color
 #
-def create_appended_palette(src_image_array, mode, img_width, img_height, k_colors, k_clusters):
+def create_appended_palette(src_img, mode, img_width, img_height, k_colors, labels):
     # Create underlying "canvas" with enough room for the palette section
-    # Make a white gap of 25 px between image and palette
-    # Make palette dimension 1/2 of image dimension, minimum 50 px
-    GAP = 25
-    MIN_PALETTE_DIMENSION = 50
-    canvas_width, canvas_height = img_width, img_height
-    shorter_dimension = min(img_width, img_height)
-    longer_dimension = max(img_height, img_width)
-    orientation = ''
-    if canvas_width == shorter_dimension:
-        canvas_width = canvas_width + GAP + max(MIN_PALETTE_DIMENSION, round(shorter_dimension / 2))
-        orientation = 'P'
-    else:
-        canvas_height = canvas_height + GAP + max(MIN_PALETTE_DIMENSION, round(shorter_dimension / 2))
-        orientation = 'L'
+    canvas_width, canvas_height, orientation, section_start = get_palette_layout(img_width, img_height)
 
     # Create copy of original image, initially all white (255, 128, 128) in PIL LAB transform
     result_img = Image.new(mode, (canvas_width, canvas_height), color=(255, 128, 128))
-    result_img_array = result_img.load()
 
     # Write original image to canvas
-    for x in range(img_width):
-        for y in range(img_height):
-            result_img_array[x, y] = src_image_array[x, y]
-
-    # Map k_clusters to a proportional length value in pixels
-    k_colors_lengths = []
-    for i in range(len(k_clusters)):
-        k_colors_lengths.append(len(k_clusters[i]))
-    total_pixels = sum(k_colors_lengths)
-    for i in range(len(k_colors_lengths)):
-        k_colors_lengths[i] = round((k_colors_lengths[i] / total_pixels) * longer_dimension)
-    # Fudge the last band a bit to avoid any gaps at the bottom
-    k_colors_lengths[len(k_colors_lengths) - 1] = longer_dimension - sum(k_colors_lengths[:-1])
-
-    # Associate the lengths with each k_color, sorted in descending order
-    map_length_to_color = {}
-    for i in range(len(k_colors_lengths)):
-        map_length_to_color[k_colors_lengths[i]] = k_colors[i]
-    sorted_length_color_tuples = sorted(map_length_to_color.items(), reverse=True)
-    # print(f"the sorted palette band lengths are: {sorted_length_color_tuples}")
+    result_img.paste(src_img, (0, 0))
+
+    # Color of each pixel along the palette section, band by band
+    band_colors = get_band_colors(k_colors, np.bincount(labels, minlength=len(k_colors)),
+                                  max(img_width, img_height))
 
     # Write the palette section onto canvas based on orientation
     if orientation == 'P':
-        x_start, y_start = img_width + GAP - 1, 0
-        for i in range(len(sorted_length_color_tuples)):
-            curr_color = sorted_length_color_tuples[i][1]
-            # Write a palette band whose height is proportional to cluster size
-            for x in range(x_start, canvas_width):
-                for y in range(y_start, y_start + sorted_length_color_tuples[i][0]):
-                    result_img_array[x, y] = curr_color
-            # Update start point of y coordinate
-            y_start += sorted_length_color_tuples[i][0]
+        section = np.broadcast_to(band_colors[:, np.newaxis, :], (canvas_height, canvas_width - section_start, 3))
+        result_img.paste(create_image(section, mode), (section_start, 0))
 
     elif orientation == 'L':
-        x_start, y_start = 0, img_height + GAP - 1
-        for i in range(len(sorted_length_color_tuples)):
-            curr_color = sorted_length_color_tuples[i][1]
-            # Write a palette band whose width is proportional to cluster size
-            for x in range(x_start, x_start + sorted_length_color_tuples[i][0]):
-                for y in range(y_start, canvas_height):
-                    result_img_array[x, y] = curr_color
-            # Update start point of y coordinate
-            x_start += sorted_length_color_tuples[i][0]
+        section = np.broadcast_to(band_colors[np.newaxis, :, :], (canvas_height - section_start, canvas_width, 3))
+        result_img.paste(create_image(section, mode), (0, section_start))
 
-    srgb_p = ImageCms.createProfile("sRGB")
-    lab_p = ImageCms.createProfile("LAB")
-    lab2rgb = ImageCms.buildTransformFromOpenProfiles(lab_p, srgb_p, "LAB", "RGB")
-    result_img = ImageCms.applyTransform(result_img, lab2rgb)
+    return color_utils.lab_to_rgb_image(result_img)
 
-    return result_img
+
+## Creates an image of the given mode from a height x width x 3 array of pixel values
+# @param pixels - height x width x 3 uint8 array
+# @param mode - 'LAB' or an RGB-like mode
+# @return PIL image object
+#
+def create_image(pixels, mode):
+    height, width = pixels.shape[:2]
+    if mode == "LAB":
+        return create_lab_image(pixels.reshape(-1, 3), width, height)
+    return Image.fromarray(np.ascontiguousarray(pixels), mode)
 
 
 ## Creates a copy of the original image except that all pixels have been replaced by
@@ -121,24 +147,68 @@ def create_appended_palette(src_image_array, mode, img_width, img_height, k_colo
 # @param mode - mode of original image (used to make copy)
 # @param img_width - width of original image
 # @param img_height - height of original image
-# @param k_clusters - clusters of coords, pixel tuples
+# @param labels - array of cluster indices for each pixel, pixel (x, y) is at index y * img_width + x
 # @param k_colors - resulting k_colors from k-means clustering (list of RGB tuples)
 # @return PIL image object of a copy of original image, with all pixels replaced by their representative
 #
-def create_reduced_image(mode, img_width, img_height, k_clusters, k_colors):
-    result_img = Image.new(mode, (img_width, img_height), color=(255, 128, 128))
-    result_img_array = result_img.load()
+def create_reduced_image(mode, img_width, img_height, labels, k_colors):
+    # Only the k palette colors go through the color transform, then labels index straight into them
+    palette = get_rgb_colors(k_colors) if mode == "LAB" else np.asarray(k_colors, dtype=np.uint8)
+    return Image.fromarray(palette[labels].reshape(img_height, img_width, 3), "RGB")
 
-    for i in range(len(k_colors)):
-        replacement_color = k_colors[i]
-        pixel_cluster = k_clusters[i]
-        for pixel in pixel_cluster:
-            x, y = pixel[0]
-            result_img_array[x, y] = replacement_color
-
-    srgb_p = ImageCms.createProfile("sRGB")
-    lab_p = ImageCms.createProfile("LAB")
-    lab2rgb = ImageCms.buildTransformFromOpenProfiles(lab_p, srgb_p, "LAB", "RGB")
-    result_img = ImageCms.applyTransform(result_img, lab2rgb)
-
-    return result_img
+
+## Converts Lab palette colors to sRGB
+# @param k_colors - list of k Lab tuples of ints
+# @return k x 3 uint8 array of sRGB colors
+#
+def get_rgb_colors(k_colors):
+    return color_utils.lab_to_rgb_pixels(np.asarray(k_colors, dtype=np.uint8).reshape(-1, 3))
+
+
+## Creates a 3D lookup table over sRGB that maps every color to the palette color of its nearest cluster,
+## so the palette can be applied to other images without clustering them
+# @param k_colors - list of k Lab tuples of ints
+# @param lut_size - number of grid points along each channel
+# @return (lut_size ** 3) x 3 uint8 array of sRGB colors, red changing fastest, then green, then blue
+#
+def create_palette_lut(k_colors, lut_size=LUT_SIZE):
+    grid = np.rint(np.linspace(0, 255, lut_size)).astype(np.uint8)
+    blues, greens, reds = np.meshgrid(grid, grid, grid, indexing='ij')
+    grid_pixels = color_utils.rgb_to_lab_pixels(np.stack([reds, greens, blues], axis=-1).reshape(-1, 3))
+    return get_rgb_colors(k_colors)[k_means_utils.get_labels_np(grid_pixels, k_colors)]
+
+
+## Writes a 3D lookup table in the .cube format read by most image and video editors
+# @param lut - (size ** 3) x 3 uint8 array from create_palette_lut
+# @param path - file path to write to
+# @param title - title stored in the file
+#
+def save_cube_lut(lut, path, title):
+    lut_size = round(len(lut) ** (1 / 3))
+    lines = [f'TITLE "{title}"', f"LUT_3D_SIZE {lut_size}"]
+    lines += [f"{r:.6f} {g:.6f} {b:.6f}" for r, g, b in (lut / 255).tolist()]
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+## Wraps a 3D lookup table as a PIL filter, e.g. img.filter(get_lut_filter(lut)) for an RGB image
+## NB the filter interpolates between grid points, so colors near a boundary between clusters can blend
+# @param lut - (size ** 3) x 3 uint8 array from create_palette_lut
+# @return PIL ImageFilter.Color3DLUT
+#
+def get_lut_filter(lut):
+    lut_size = round(len(lut) ** (1 / 3))
+    return ImageFilter.Color3DLUT(lut_size, (lut / 255).ravel().tolist())
+
+
+## Creates a LAB image from a compact array of pixels (the inverse of k_means_utils.get_lab_pixel_array)
+# @param pixels - N x 3 uint8 array of Lab values, pixel (x, y) is at index y * img_width + x
+# @param img_width - width of image
+# @param img_height - height of image
+# @return PIL image object in LAB mode
+#
+def create_lab_image(pixels, img_width, img_height):
+    # PIL stores a and b as signed bytes internally, so undo the offset of 128
+    raw_pixels = pixels.copy()
+    raw_pixels[:, 1:] ^= 128
+    return Image.frombytes("LAB", (img_width, img_height), raw_pixels.tobytes())
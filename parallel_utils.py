@@ -0,0 +1,130 @@
+## Name: Eddie Wu
+## Description: Functions for running k-means jobs across a process pool with the pixel buffers in shared memory
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import copy
+from multiprocessing import shared_memory
+import numpy as np
+from Image_Writer import Image_Writer
+from Memory_Logger import Memory_Logger
+import palette_utils
+
+# K_Means arrays that workers read but never modify, so they are placed in shared memory once
+SHARED_ARRAY_NAMES = ('src_pixels', 'fit_pixels', 'fit_weights', 'assign_pixels', 'assign_weights', 'pyramid_pixels',
+                      'unique_keys')
+
+# Per-process state set up by init_worker: K_Means copy with shared arrays attached, source image and segments
+_worker_state = {}
+
+
+## Runs k-means jobs on a process pool and yields each job's output as soon as it finishes, so the caller can keep
+## only the results it needs rather than holding every job's results until all jobs are done
+# @param k_means - K_Means instance with its pixel arrays loaded
+# @param jobs - list of (run_num, list of k values) tuples
+# @param mode - mode of the image used for result images
+# @param img_width - width of image
+# @param img_height - height of image
+# @param num_workers - number of worker processes
+# @return iterator of (job index, (log lines, list of (k, Palette_Result or None), time elapsed)) tuples, in the
+#         order jobs finish
+#
+def run_jobs(k_means, jobs, mode, img_width, img_height, num_workers):
+    segments = []
+    try:
+        # Share each distinct array once; arrays that are the same object (e.g. fit_pixels is src_pixels) are aliased
+        array_specs = {}
+        shared_ids = {}
+        for name in SHARED_ARRAY_NAMES:
+            array = getattr(k_means, name)
+            if array is None:
+                array_specs[name] = None
+            elif id(array) in shared_ids:
+                array_specs[name] = shared_ids[id(array)]
+            else:
+                segment, array_specs[name] = share_array(array)
+                segments.append(segment)
+                shared_ids[id(array)] = name
+
+        # Copy of the K_Means settings without its arrays, so only the shared memory names are sent to workers
+        template = copy(k_means)
+        for name in SHARED_ARRAY_NAMES:
+            setattr(template, name, None)
+        template.SSE = {}
+        template.best_results = {}
+        template.image_writer = None
+
+        # Jobs seed their own random streams from the K_Means seed, so results do not depend on which worker runs them
+        with ProcessPoolExecutor(num_workers, initializer=init_worker,
+                                 initargs=(template, array_specs, mode, img_width, img_height)) as executor:
+            futures = {executor.submit(run_worker_job, job): job_idx for job_idx, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                # Drop the finished future, so its output is freed once the caller is done with it
+                yield futures.pop(future), future.result()
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+## Copies an array into a new shared memory segment
+# @param array - NumPy array
+# @return tuple of (SharedMemory segment, (segment name, shape, dtype string)) where the spec can be pickled
+#
+def share_array(array):
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+    shared[...] = array
+    return segment, (segment.name, array.shape, array.dtype.str)
+
+
+## Attaches to an array in an existing shared memory segment
+# @param spec - (segment name, shape, dtype string) tuple from share_array
+# @return tuple of (SharedMemory segment, read-only NumPy array backed by the segment)
+#
+def attach_array(spec):
+    name, shape, dtype = spec
+    # Pool workers share the parent's resource tracker, and the parent unlinks the segment once the pool is done
+    segment = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    array.flags.writeable = False
+    return segment, array
+
+
+## Pool initializer: attaches the shared arrays and rebuilds the source image once per worker process
+# @param template - K_Means copy without its arrays
+# @param array_specs - dict mapping array name to a shared memory spec, the name of an aliased array, or None
+# @param mode - mode of the image used for result images
+# @param img_width - width of image
+# @param img_height - height of image
+#
+def init_worker(template, array_specs, mode, img_width, img_height):
+    segments = []
+    for name in SHARED_ARRAY_NAMES:
+        spec = array_specs[name]
+        if isinstance(spec, tuple):
+            segment, array = attach_array(spec)
+            segments.append(segment)
+            setattr(template, name, array)
+    for name in SHARED_ARRAY_NAMES:
+        if isinstance(array_specs[name], str):
+            setattr(template, name, getattr(template, array_specs[name]))
+    lab_img = palette_utils.create_lab_image(template.src_pixels, img_width, img_height)
+    _worker_state.update(k_means=template, segments=segments, lab_img=lab_img, mode=mode, img_width=img_width,
+                         img_height=img_height)
+
+
+## Runs one job in a worker process, logging into memory so the parent can write the log in job order
+# @param job - (run_num, list of k values) tuple
+# @return tuple of (log lines, list of (k, Palette_Result or None), time elapsed)
+#
+def run_worker_job(job):
+    run_num, k_list = job
+    k_means = _worker_state['k_means']
+    start_total_time = k_means.total_time
+    with Memory_Logger() as logger, Image_Writer(k_means.num_writers) as k_means.image_writer:
+        results = k_means.run_job(run_num, k_list, _worker_state['lab_img'], _worker_state['mode'],
+                                  _worker_state['img_width'], _worker_state['img_height'], logger)
+        # Result files must be on disk before the job is reported done
+        k_means.image_writer.wait(logger)
+    k_means.image_writer = None
+    return logger.lines, results, k_means.total_time - start_total_time
@@ -0,0 +1,219 @@
+## Name: Eddie Wu
+## Description: Module for fast histogram-based color quantizers (median cut, octree, Wu) that share the interface
+##              of k-means seeding: each takes points, k and optional weights and returns k colors
+
+import numpy as np
+import k_means_utils
+
+# Depth of the color octree, i.e. number of leading bits of each channel that octree leaves can tell apart
+OCTREE_DEPTH = 6
+# Number of leading bits of each channel kept in the histogram for Wu's quantizer
+WU_BITS = 5
+
+
+## Collapses points into distinct colors with counts, unless they are already weighted (e.g. unique colors)
+# @param points - N x 3 array of pixel values
+# @param point_weights - optional array of N weights, None if every point counts once
+# @return tuple of (M x 3 array of colors, array of M weights)
+#
+def get_color_histogram(points, point_weights=None):
+    if point_weights is not None:
+        return points, np.asarray(point_weights, dtype=np.float64)
+    _, colors, counts = k_means_utils.get_unique_colors(points)
+    return colors, counts.astype(np.float64)
+
+
+## Tops up a quantizer's colors to exactly k with k-means++ picks, for images with fewer boxes or leaves than k
+# @param histogram_colors - M x 3 array of distinct colors from get_color_histogram
+# @param histogram_weights - array of M weights from get_color_histogram
+# @param colors - list of tuples found by a quantizer
+# @param k - number of colors needed
+# @param rng - optional numpy.random.Generator for the k-means++ picks, a fresh one if None
+# @return list of k tuples
+#
+def fill_colors(histogram_colors, histogram_weights, colors, k, rng=None):
+    if len(colors) >= k:
+        return colors
+    return k_means_utils.add_k_means_plus_plus_centroids(histogram_colors, colors, k - len(colors),
+                                                         histogram_weights, rng)
+
+
+## Median cut: repeatedly splits the box of colors with the widest channel range at the weighted median of that
+## channel, then takes the weighted mean of each box
+# @param points - N x 3 array of pixel values
+# @param k - number of colors (int)
+# @param point_weights - optional array of N weights (e.g. pixel counts of unique colors)
+# @param rng - optional numpy.random.Generator for topping up with k-means++ picks, a fresh one if None
+# @return list of k tuples of floats
+#
+def get_median_cut_colors(points, k, point_weights=None, rng=None):
+    colors, weights = get_color_histogram(points, point_weights)
+    colors = colors.astype(np.float64)
+    # Each box is (indices of its colors, per-channel ranges)
+    boxes = [(np.arange(len(colors)), np.ptp(colors, axis=0))]
+    while len(boxes) < k:
+        box_num = max(range(len(boxes)), key=lambda i: boxes[i][1].max())
+        box_idx, box_ranges = boxes[box_num]
+        if box_ranges.max() <= 0:
+            break
+        axis = int(np.argmax(box_ranges))
+        values = colors[box_idx, axis]
+        order = np.argsort(values, kind='stable')
+        cum_weights = np.cumsum(weights[box_idx][order])
+        median = values[order][np.searchsorted(cum_weights, cum_weights[-1] / 2)]
+        # Cut between distinct values so equal colors stay together; the range is positive so one side is non-empty
+        lower = values <= median
+        if lower.all():
+            lower = values < median
+        boxes[box_num:box_num + 1] = [(box_idx[side], np.ptp(colors[box_idx[side]], axis=0))
+                                      for side in (lower, ~lower)]
+    box_colors = [tuple(np.average(colors[box_idx], axis=0, weights=weights[box_idx]).tolist())
+                  for box_idx, _ in boxes]
+    return fill_colors(colors, weights, box_colors, k, rng)
+
+
+## Octree: places colors in leaves of an octree over the color cube, then merges the smallest sibling groups into
+## their parents, deepest level first, until at most k leaves are left
+## NB merging a group removes all but one of its leaves at once, so this can undershoot k (made up by fill_colors)
+# @param points - N x 3 array of pixel values
+# @param k - number of colors (int)
+# @param point_weights - optional array of N weights (e.g. pixel counts of unique colors)
+# @param depth - number of levels in the octree
+# @param rng - optional numpy.random.Generator for topping up with k-means++ picks, a fresh one if None
+# @return list of k tuples of floats
+#
+def get_octree_colors(points, k, point_weights=None, depth=OCTREE_DEPTH, rng=None):
+    colors, weights = get_color_histogram(points, point_weights)
+    # Node coordinates at the deepest level, and each leaf's weight and weighted channel sums
+    nodes = colors.astype(np.int64) >> (8 - depth)
+    sums = colors * weights[:, np.newaxis]
+    nodes, inverse = np.unique(nodes, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    node_weights = np.bincount(inverse, weights=weights)
+    node_sums = np.stack([np.bincount(inverse, weights=sums[:, channel]) for channel in range(3)], axis=1)
+
+    # Leaves settled at shallower levels than the current one, as (weights, sums) arrays
+    settled_weights, settled_sums = [], []
+    for _ in range(depth):
+        num_leaves = len(nodes) + sum(len(level_weights) for level_weights in settled_weights)
+        if num_leaves <= k:
+            break
+        parents, parent_inverse, num_children = np.unique(nodes >> 1, axis=0, return_inverse=True,
+                                                          return_counts=True)
+        parent_inverse = parent_inverse.ravel()
+        parent_weights = np.bincount(parent_inverse, weights=node_weights)
+        # Merge the lightest parents first until enough leaves are gone
+        order = np.argsort(parent_weights, kind='stable')
+        num_merged = int(np.searchsorted(np.cumsum(num_children[order] - 1), num_leaves - k)) + 1
+        merged = np.zeros(len(parents), dtype=bool)
+        merged[order[:num_merged]] = True
+        # Children of unmerged parents stay as leaves at this level
+        kept = ~merged[parent_inverse]
+        settled_weights.append(node_weights[kept])
+        settled_sums.append(node_sums[kept])
+        parent_sums = np.stack([np.bincount(parent_inverse, weights=node_sums[:, channel]) for channel in range(3)],
+                               axis=1)
+        nodes, node_weights, node_sums = parents[merged], parent_weights[merged], parent_sums[merged]
+
+    leaf_weights = np.concatenate([node_weights] + settled_weights)
+    leaf_sums = np.concatenate([node_sums] + settled_sums)
+    leaf_colors = leaf_sums[leaf_weights > 0] / leaf_weights[leaf_weights > 0, np.newaxis]
+    return fill_colors(colors, weights, [tuple(color) for color in leaf_colors.tolist()], k, rng)
+
+
+## Sums the moments of a box (or of several boxes sharing all but one bound) from cumulative moment tables
+# @param moments - cumulative moments array of shape (bins + 1, bins + 1, bins + 1, 5)
+# @param lows - 3 exclusive lower bounds (ints or arrays)
+# @param highs - 3 inclusive upper bounds (ints or arrays)
+# @return array of 5 moments (weight, 3 channel sums, sum of squares), or one row per box
+#
+def get_box_moments(moments, lows, highs):
+    total = 0
+    for corner in range(8):
+        index = tuple(highs[axis] if corner >> axis & 1 else lows[axis] for axis in range(3))
+        # Inclusion-exclusion: each lower bound flips the sign
+        sign = -1 if (3 - bin(corner).count('1')) % 2 else 1
+        total = total + sign * moments[index]
+    return total
+
+
+## Returns the part of a box's SSE removed by replacing its colors with their mean: |sums| ^ 2 / weight
+# @param box_moments - array of 5 moments, or rows of them
+# @return float, or array of floats (0 for empty boxes)
+#
+def get_mean_score(box_moments):
+    box_moments = np.asarray(box_moments)
+    weights = box_moments[..., 0]
+    sq_sums = (box_moments[..., 1:4] ** 2).sum(axis=-1)
+    return np.where(weights > 0, sq_sums / np.where(weights > 0, weights, 1), 0.0)
+
+
+## Wu's quantizer: builds cumulative moments over a coarse color histogram, then repeatedly cuts the box with the
+## largest SSE where the cut leaves the least SSE, and takes the mean of each box
+# @param points - N x 3 array of pixel values
+# @param k - number of colors (int)
+# @param point_weights - optional array of N weights (e.g. pixel counts of unique colors)
+# @param bits - number of leading bits of each channel kept in the histogram
+# @param rng - optional numpy.random.Generator for topping up with k-means++ picks, a fresh one if None
+# @return list of k tuples of floats
+#
+def get_wu_colors(points, k, point_weights=None, bits=WU_BITS, rng=None):
+    colors, weights = get_color_histogram(points, point_weights)
+    num_bins = (1 << bits) + 1
+    # Bin 0 along each axis stays empty so every box can use an exclusive lower bound
+    bin_coords = (colors.astype(np.int64) >> (8 - bits)) + 1
+    flat_bins = (bin_coords[:, 0] * num_bins + bin_coords[:, 1]) * num_bins + bin_coords[:, 2]
+    values = colors.astype(np.float64)
+    moment_values = [weights] + [values[:, channel] * weights for channel in range(3)]
+    moment_values.append((values ** 2).sum(axis=1) * weights)
+    moments = np.stack([np.bincount(flat_bins, weights=moment, minlength=num_bins ** 3)
+                        for moment in moment_values], axis=1).reshape(num_bins, num_bins, num_bins, 5)
+    for axis in range(3):
+        moments = np.cumsum(moments, axis=axis)
+
+    # Each box is (lows, highs, moments); its SSE is sum of squares - |sums| ^ 2 / weight
+    whole = ([0, 0, 0], [num_bins - 1] * 3)
+    boxes = [(*whole, get_box_moments(moments, *whole))]
+    box_SSEs = [boxes[0][2][4] - get_mean_score(boxes[0][2])]
+    while len(boxes) < k:
+        box_num = int(np.argmax(box_SSEs))
+        if box_SSEs[box_num] <= 0:
+            break
+        lows, highs, box_moments = boxes[box_num]
+        best = None
+        for axis in range(3):
+            cuts = np.arange(lows[axis] + 1, highs[axis])
+            if len(cuts) == 0:
+                continue
+            cut_highs = list(highs)
+            cut_highs[axis] = cuts
+            lower_moments = get_box_moments(moments, lows, cut_highs)
+            upper_moments = box_moments - lower_moments
+            scores = get_mean_score(lower_moments) + get_mean_score(upper_moments)
+            # Only cuts that leave both halves non-empty
+            scores[(lower_moments[:, 0] <= 0) | (upper_moments[:, 0] <= 0)] = -np.inf
+            cut_num = int(np.argmax(scores))
+            if np.isfinite(scores[cut_num]) and (best is None or scores[cut_num] > best[0]):
+                best = (scores[cut_num], axis, int(cuts[cut_num]))
+        if best is None:
+            # Every color in the box shares one histogram bin, so it cannot be cut
+            box_SSEs[box_num] = 0
+            continue
+        _, axis, cut = best
+        lower_highs, upper_lows = list(highs), list(lows)
+        lower_highs[axis], upper_lows[axis] = cut, cut
+        new_boxes = [(lows, lower_highs), (upper_lows, highs)]
+        boxes[box_num:box_num + 1] = [(box_lows, box_highs, get_box_moments(moments, box_lows, box_highs))
+                                      for box_lows, box_highs in new_boxes]
+        box_SSEs[box_num:box_num + 1] = [box[2][4] - get_mean_score(box[2]) for box in boxes[box_num:box_num + 2]]
+    box_colors = [tuple((box_moments[1:4] / box_moments[0]).tolist()) for _, _, box_moments in boxes
+                  if box_moments[0] > 0]
+    return fill_colors(colors, weights, box_colors, k, rng)
+
+
+# Quantizers by name, all called as quantizer(points, k, point_weights)
+QUANTIZERS = {
+    'median cut': get_median_cut_colors,
+    'octree': get_octree_colors,
+    'wu': get_wu_colors,
+}
@@ -1,10 +1,39 @@
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 import os
 from K_Means import K_Means
-from k_means_utils import get_timestamp_str
+from k_means_utils import MAX_SEED, get_timestamp_str
+from Result_Cache import Result_Cache
 
 # Specify port for HTTP server
 PORT = 8000
+# Response formats the Accept header can choose between, the rendered image first as the default
+RESPONSE_TYPES = ('image/jpeg', 'application/json', 'application/octet-stream')
+# Results of earlier requests, so repeating an image with the same parameters skips decoding and clustering
+result_cache = Result_Cache()
+
+
+# Picks the response format the client accepts with the highest quality, ties going to the earlier format
+# accept_header: value of the Accept header, None if missing
+def get_response_type(accept_header):
+    qualities = {}
+    for media_range in (accept_header or '').split(','):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        for response_type in RESPONSE_TYPES:
+            if media_type in (response_type, '*/*', response_type.split('/')[0] + '/*'):
+                qualities[response_type] = max(qualities.get(response_type, 0.0), quality)
+    accepted_types = [response_type for response_type in RESPONSE_TYPES if qualities.get(response_type, 0.0) > 0]
+    if not accepted_types:
+        return RESPONSE_TYPES[0]
+    return max(accepted_types, key=lambda response_type: qualities[response_type])
 
 
 # Subclass the base handler to implement custom GET and POST handlers
@@ -22,6 +51,10 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
 
     # Handles POST requests that send an image via 'curl'
     # 'curl' command: curl -X POST --data-binary "@/image_path" http://localhost:PORT
+    # Optionally add ?seed=<int> to the URL to replay a previous result; the seed used is sent back as X-Seed
+    # Send 'Accept: application/json' for just the palette, or 'Accept: application/octet-stream' for the palette and
+    # label map in the compact binary layout; neither renders an image
+    # Repeated images with the same parameters are answered from the result cache, sent back as X-Cache: HIT
     # path: /Users/ediwu/Desktop/img3.jpg
     def do_POST(self):
         print("Incoming POST request.")
@@ -31,13 +64,6 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         content_length = int(self.headers.get("Content-Length"))
         # Read entire binary data
         data = self.rfile.read(content_length)
-        # Write data into a jpeg file
-        FILE_NAME = "src_images/flowers.jpeg"
-        with open(FILE_NAME, "wb") as img:
-            img.write(data)
-        ### Call UI tools function to run image processing module
-        ### present_menu()
-        # Instantiate K-Means object and run process
         # DEFAULTS
         project_name = "DEFAULT_PROJECT"
         k_values = (6, 6, 1)
@@ -45,23 +71,58 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         img_extension = ".jpeg"
         palette_replace = True
         resize_level = 100
-        file_path = os.path.join(os.getcwd(), FILE_NAME)
         log_file_name = f"{get_timestamp_str()}__{project_name}_{str(num_runs)}x_{k_values[0]}"
+        seed_values = parse_qs(urlparse(self.path).query).get('seed')
+        if seed_values and (not seed_values[0].isdecimal() or int(seed_values[0]) >= MAX_SEED):
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(f"Invalid seed: {seed_values[0]}".encode())
+            return
+        seed = int(seed_values[0]) if seed_values else None
+        response_type = get_response_type(self.headers.get("Accept"))
         # END DEFAULTS
-        k_means_process = K_Means(project_name, k_values, file_path, num_runs, log_file_name, img_extension,
-                                  palette_replace, resize_level)
-        partial_result_path = k_means_process.run()
+        cache_key = Result_Cache.get_key(data, k_values, resize_level, 'k-means', seed)
+        result = result_cache.get(cache_key, need_image=response_type == 'image/jpeg')
+        cache_status = 'HIT' if result is not None else 'MISS'
+        if result is None:
+            # Write data into a jpeg file
+            FILE_NAME = "src_images/flowers.jpeg"
+            with open(FILE_NAME, "wb") as img:
+                img.write(data)
+            ### Call UI tools function to run image processing module
+            ### present_menu()
+            # Instantiate K-Means object and run process
+            file_path = os.path.join(os.getcwd(), FILE_NAME)
+            k_means_process = K_Means(project_name, k_values, file_path, num_runs, log_file_name, img_extension,
+                                      palette_replace, resize_level, seed=seed,
+                                      render_best=None if response_type == 'image/jpeg' else 0)
+            result = k_means_process.run()
+            if result is None:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write("Palette extraction failed".encode())
+                return
+            result_cache.put(cache_key, result)
 
-        # Read from result image from path and return to user
-        result_image_path = os.path.join(os.getcwd(), partial_result_path)
+        if response_type == 'application/json':
+            body = result.to_json().encode()
+        elif response_type == 'application/octet-stream':
+            body = result.to_bytes()
+        else:
+            # Read from result image from path and return to user
+            result_image_path = os.path.join(os.getcwd(), result.image_path)
+            with open(result_image_path, 'rb') as result_image:
+                body = result_image.read()
 
         # Send response
         self.send_response(200)
-        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Type', response_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Seed', str(result.seed))
+        self.send_header('X-Cache', cache_status)
         self.end_headers()
         # self.wfile.write('okay'.encode())
-        with open(result_image_path, 'rb') as result_image:
-            self.wfile.write(result_image.read())
+        self.wfile.write(body)
 
 
 # Runs http server on specified port
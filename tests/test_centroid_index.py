@@ -0,0 +1,20 @@
+from unittest import TestCase
+import numpy as np
+from Centroid_Index import Centroid_Index
+from k_means_utils import get_cluster_id, get_weight
+
+
+class TestCentroidIndex(TestCase):
+    # Should find the same closest centroid and distance as a linear scan, for single pixels and arrays
+    def test_matches_linear_scan(self):
+        rng = np.random.default_rng(2)
+        pixels = rng.integers(0, 256, size=(3000, 3), dtype=np.uint8)
+        k_colors = [tuple(pixel) for pixel in rng.integers(0, 256, size=(80, 3)).tolist()]
+        # Duplicate a centroid so ties must resolve to the lower index
+        k_colors.append(k_colors[10])
+        centroid_index = Centroid_Index(k_colors)
+        labels, sq_dists = centroid_index.query(pixels, chunk_size=1000)
+        for i, pixel in enumerate(pixels.tolist()):
+            self.assertEqual(get_cluster_id(pixel, k_colors), labels[i])
+            self.assertEqual(get_weight(k_colors, pixel), sq_dists[i])
+            self.assertEqual((labels[i], sq_dists[i]), centroid_index.nearest(pixel))
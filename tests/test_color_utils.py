@@ -0,0 +1,23 @@
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from color_utils import *
+from k_means_utils import get_lab_pixel_array
+
+
+class TestTransforms(TestCase):
+    # Should build each transform once and hand the same one to every thread
+    def test_shared_transform(self):
+        with ThreadPoolExecutor(4) as executor:
+            transforms = list(executor.map(lambda _: get_transform("LAB", "RGB"), range(8)))
+        self.assertTrue(all(transform is transforms[0] for transform in transforms))
+
+
+class TestPixelConversion(TestCase):
+    # Should convert buffers in place to the same values as converting the image and reading its pixel array
+    def test_matches_image_conversion(self):
+        pixels = np.random.default_rng(0).integers(0, 256, (300, 3)).astype(np.uint8)
+        expected_pixels = get_lab_pixel_array(rgb_to_lab_image(Image.fromarray(pixels.reshape(10, 30, 3), "RGB")))
+        rgb_to_lab_pixels(pixels, out=pixels)
+        self.assertEqual(expected_pixels.tolist(), pixels.tolist())
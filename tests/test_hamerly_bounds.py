@@ -0,0 +1,20 @@
+from unittest import TestCase
+import numpy as np
+from Hamerly_Bounds import Hamerly_Bounds
+from k_means_utils import get_labels_np, update_k_colors_np
+
+
+class TestHamerlyAssign(TestCase):
+    # Should give the same labels as exhaustive assignment on every iteration while skipping distances
+    def test_matches_exhaustive_labels(self):
+        rng = np.random.default_rng(1)
+        pixels = rng.integers(0, 256, size=(2000, 3), dtype=np.uint8)
+        k_colors = [tuple(pixel) for pixel in pixels[:6].tolist()]
+        labels = np.zeros(len(pixels), dtype=np.uint8)
+        bounds = Hamerly_Bounds(pixels, chunk_size=300)
+        total_skipped = 0
+        for _ in range(8):
+            total_skipped += bounds.assign(k_colors, labels)
+            self.assertEqual(get_labels_np(pixels, k_colors).tolist(), labels.tolist())
+            k_colors = update_k_colors_np(pixels, labels, 6)
+        self.assertGreater(total_skipped, 0)
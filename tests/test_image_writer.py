@@ -0,0 +1,47 @@
+from unittest import TestCase
+import os
+import tempfile
+import threading
+from PIL import Image
+from Image_Writer import Image_Writer
+from Memory_Logger import Memory_Logger
+
+
+class TestImageWriter(TestCase):
+    # Should have every image saved once wait returns, in the background or on the calling thread
+    def test_saves_images(self):
+        for num_threads in (0, 2):
+            with self.subTest(num_threads=num_threads), tempfile.TemporaryDirectory() as tmp_dir, \
+                    Memory_Logger() as logger, Image_Writer(num_threads) as image_writer:
+                paths = [os.path.join(tmp_dir, f"{i}.png") for i in range(5)]
+                for i, path in enumerate(paths):
+                    image_writer.save_image(Image.new("RGB", (4, 3), (i, 0, 0)), path)
+                self.assertEqual(0, image_writer.wait(logger))
+                for i, path in enumerate(paths):
+                    with Image.open(path) as img:
+                        self.assertEqual((i, 0, 0), img.getpixel((0, 0)))
+                self.assertEqual([], logger.lines)
+
+    # Should log failed writes when waiting instead of raising them
+    def test_logs_failures(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, Memory_Logger() as logger, Image_Writer(1) as image_writer:
+            bad_path = os.path.join(tmp_dir, "missing", "a.png")
+            image_writer.save_image(Image.new("RGB", (2, 2)), bad_path)
+            image_writer.save_image(Image.new("RGB", (2, 2)), os.path.join(tmp_dir, "b.png"))
+            self.assertEqual(1, image_writer.wait(logger))
+            self.assertEqual(1, len(logger.lines))
+            self.assertIn(bad_path, logger.lines[0])
+
+    # Should block submitting once max_pending writes are queued or in progress
+    def test_bounds_pending_writes(self):
+        release = threading.Event()
+        with Memory_Logger() as logger, Image_Writer(1, max_pending=2) as image_writer:
+            image_writer.submit("first", release.wait)
+            image_writer.submit("second", release.wait)
+            third = threading.Thread(target=image_writer.submit, args=("third", lambda: None))
+            third.start()
+            third.join(0.2)
+            self.assertTrue(third.is_alive())
+            release.set()
+            third.join()
+            self.assertEqual(0, image_writer.wait(logger))
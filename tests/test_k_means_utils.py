@@ -1,4 +1,5 @@
 from unittest import TestCase
+import random
 from time import sleep
 from k_means_utils import *
 
@@ -58,3 +59,220 @@ class TestGetTimestampStr(TestCase):
         time_str3 = get_timestamp_str()
         str_list = [time_str1, time_str2, time_str3]
         self.assertEqual(str_list, sorted(str_list))
+
+
+class TestGetLabelsNp(TestCase):
+    # Should label each pixel with the same cluster index as get_cluster_id, including first index on ties
+    def test_matches_get_cluster_id(self):
+        k_colors = [(0, 0, 0), (128, 128, 128), (255, 255, 255), (64, 64, 64)]
+        pixels = [(0, 0, 0), (32, 32, 32), (100, 120, 140), (250, 3, 255), (200, 200, 200), (96, 96, 96)]
+        expected_labels = [get_cluster_id(pixel, k_colors) for pixel in pixels]
+        actual_labels = get_labels_np(np.array(pixels, dtype=np.uint8), k_colors, chunk_size=4).tolist()
+        self.assertEqual(expected_labels, actual_labels)
+
+
+class TestUpdateKColorsNp(TestCase):
+    # Should calculate the same rounded averages as update_k_colors
+    def test_matches_update_k_colors(self):
+        pixels = [(0, 0, 0), (174, 4, 6), (255, 255, 255), (81, 160, 37), (149, 156, 182), (13, 77, 122)]
+        labels = np.array([0, 1, 0, 1, 1, 0])
+        expected_k_colors = update_k_colors(np.array(pixels, dtype=np.uint8), labels, 2)
+        actual_k_colors = update_k_colors_np(np.array(pixels, dtype=np.uint8), labels, 2)
+        self.assertEqual(expected_k_colors, actual_k_colors)
+
+    # Should raise ZeroDivisionError when a cluster has no pixels
+    def test_empty_cluster(self):
+        pixels = np.array([(0, 0, 0), (255, 255, 255)], dtype=np.uint8)
+        self.assertRaises(ZeroDivisionError, update_k_colors_np, pixels, np.array([0, 0]), 2)
+
+
+class TestGetTotalSSE(TestCase):
+    # Should sum squared distances between each pixel and the centroid its label points to
+    def test_total_sse_from_labels(self):
+        k_colors = [(10, 20, 30), (200, 100, 50)]
+        pixels = [(12, 20, 27), (10, 20, 30), (190, 105, 50), (255, 0, 0)]
+        labels = [0, 0, 1, 1]
+        expected_sse = sum(get_sq_euclidean_dist(pixel, k_colors[label]) for pixel, label in zip(pixels, labels))
+        actual_sse = get_total_SSE(k_colors, np.array(pixels, dtype=np.uint8), np.array(labels), chunk_size=3)
+        self.assertEqual(expected_sse, actual_sse)
+
+
+class TestUniqueColors(TestCase):
+    # Should give the same centroids, SSE and per-pixel labels as clustering every pixel
+    def test_weighted_unique_colors_match_all_pixels(self):
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(0, 4, size=(500, 3), dtype=np.uint8) * 60
+        k_colors = [(0, 0, 0), (120, 60, 180), (180, 180, 60)]
+        unique_keys, unique_colors, counts = get_unique_colors(pixels)
+        self.assertEqual(len(pixels), counts.sum())
+
+        labels = get_labels_np(pixels, k_colors)
+        unique_labels = get_labels_np(unique_colors, k_colors)
+        self.assertEqual(labels.tolist(), expand_unique_labels(pixels, unique_keys, unique_labels).tolist())
+        self.assertEqual(update_k_colors_np(pixels, labels, 3),
+                         update_k_colors_np(unique_colors, unique_labels, 3, counts))
+        self.assertEqual(get_total_SSE(k_colors, pixels, labels),
+                         get_total_SSE(k_colors, unique_colors, unique_labels, counts))
+
+
+class TestGetPyramidLevels(TestCase):
+    # Should average 2 x 2 blocks, dropping the odd last column, and stop once a dimension would reach zero
+    def test_block_averages(self):
+        pixels = np.array([(0, 0, 0), (4, 8, 12), (0, 0, 0), (8, 8, 8), (8, 8, 8), (100, 100, 100)] * 2,
+                          dtype=np.uint8)
+        pixels[6:9] += 2
+        levels = get_pyramid_levels(pixels, 3, 4, 3)
+        self.assertEqual(1, len(levels))
+        self.assertEqual([[5, 6, 7], [6, 7, 8]], levels[0].tolist())
+
+
+class TestUpdateMiniBatchCentroids(TestCase):
+    # Should keep each centroid at the running mean of every pixel it has absorbed across batches
+    def test_running_mean(self):
+        centroids = np.array([[0.0, 0.0, 0.0], [200.0, 200.0, 200.0]])
+        centroid_counts = np.zeros(2)
+        batch1 = np.array([(10, 20, 30), (30, 40, 50), (250, 250, 250)], dtype=np.uint8)
+        batch2 = np.array([(50, 60, 70)], dtype=np.uint8)
+        update_mini_batch_centroids(centroids, centroid_counts, batch1, np.array([0, 0, 1]))
+        update_mini_batch_centroids(centroids, centroid_counts, batch2, np.array([0]))
+        self.assertEqual([[30, 40, 50], [250, 250, 250]], centroids.tolist())
+        self.assertEqual([3, 1], centroid_counts.tolist())
+
+
+class TestSeeding(TestCase):
+    # Should pick every distinct color when there are exactly k of them, since chosen colors get zero weight
+    def test_k_means_plus_plus_picks_distinct_colors(self):
+        colors = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        points = np.array(colors * 50, dtype=np.uint8)
+        self.assertEqual(sorted(colors), sorted(get_k_means_plus_plus_centroids(points, 4)))
+
+    # Should return k centroids taken from the points, falling back to k-means++ when candidates run short
+    def test_k_means_parallel_centroids(self):
+        colors = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        points = np.array(colors * 50, dtype=np.uint8)
+        weights = np.arange(1, len(points) + 1)
+        centroids = get_k_means_parallel_centroids(points, 4, weights)
+        self.assertEqual(sorted(colors), sorted(centroids))
+
+
+class TestLightweightCoreset(TestCase):
+    # Should sample evenly and keep the total weight of the points when every point is the same
+    def test_identical_points(self):
+        points = np.array([(40, 50, 60)] * 100, dtype=np.uint8)
+        coreset, coreset_weights = get_lightweight_coreset(points, 10, np.full(100, 3))
+        self.assertLessEqual(len(coreset), 10)
+        self.assertEqual({(40, 50, 60)}, set(map(tuple, coreset.tolist())))
+        self.assertAlmostEqual(300, coreset_weights.sum())
+
+    # Should estimate the SSE of a set of centroids on every point from the weighted coreset
+    def test_estimates_sse(self):
+        points = np.random.default_rng(0).integers(0, 256, (20000, 3)).astype(np.uint8)
+        coreset, coreset_weights = get_lightweight_coreset(points, 2000, rng=get_rng(0))
+        k_colors = [(20, 40, 60), (200, 100, 50), (128, 128, 128)]
+        full_SSE = get_total_SSE(k_colors, points, get_labels_np(points, k_colors))
+        coreset_SSE = get_total_SSE(k_colors, coreset, get_labels_np(coreset, k_colors), coreset_weights)
+        self.assertAlmostEqual(1, coreset_SSE / full_SSE, delta=0.05)
+
+
+class TestSplitClusters(TestCase):
+    # Should split the cluster with the highest SSE, leaving the tight cluster alone
+    def test_splits_highest_sse_cluster(self):
+        pixels = np.array([(10, 10, 10)] * 20 + [(100, 50, 50)] * 10 + [(200, 50, 50)] * 10, dtype=np.uint8)
+        labels = np.array([0] * 20 + [1] * 20)
+        k_colors = [(10, 10, 10), (150, 50, 50)]
+        result = split_clusters(pixels, labels, k_colors, 1)
+        self.assertEqual((10, 10, 10), result[0])
+        self.assertEqual([(100, 50, 50), (200, 50, 50)], sorted(result[1:]))
+
+
+class TestClusterChunks(TestCase):
+    # Should give the same per-cluster SSEs and farthest pixels chunk by chunk as in one pass, ties to lower indices
+    def test_chunks_match_one_pass(self):
+        rng = np.random.default_rng(6)
+        pixels = rng.integers(0, 4, size=(50, 3), dtype=np.uint8) * 60
+        k_colors = [(0, 0, 0), (120, 120, 120), (240, 0, 60)]
+        labels = get_labels_np(pixels, k_colors)
+        weights = rng.integers(1, 5, size=50)
+        np.testing.assert_allclose(get_cluster_SSEs(k_colors, pixels, labels, weights, chunk_size=50),
+                                   get_cluster_SSEs(k_colors, pixels, labels, weights, chunk_size=7))
+        sq_dists = next(get_label_sq_dists(k_colors, pixels, labels, chunk_size=50))[2]
+        farthest_idx, _ = get_farthest_pixels(k_colors, pixels, labels, 10, chunk_size=3)
+        self.assertEqual(np.argsort(-sq_dists, kind='stable')[:10].tolist(), farthest_idx.tolist())
+
+
+class TestReseedEmptyClusters(TestCase):
+    # Should move the pixel farthest from its centroid into the empty cluster
+    def test_farthest(self):
+        pixels = np.array([(0, 0, 0), (10, 0, 0), (200, 0, 0), (40, 0, 0)], dtype=np.uint8)
+        labels = np.array([0, 0, 0, 0])
+        self.assertEqual(1, reseed_empty_clusters(pixels, labels, [(0, 0, 0), (0, 0, 0)]))
+        self.assertEqual([0, 0, 1, 0], labels.tolist())
+
+    # Should move one side of the highest-SSE cluster, split at its mean, into the empty cluster
+    def test_split(self):
+        pixels = np.array([(0, 0, 0), (2, 0, 0), (100, 0, 0), (120, 0, 0), (140, 0, 0)], dtype=np.uint8)
+        labels = np.array([0, 0, 1, 1, 1])
+        k_colors = [(1, 0, 0), (120, 0, 0), (120, 0, 0)]
+        self.assertEqual(1, reseed_empty_clusters(pixels, labels, k_colors, method='split'))
+        self.assertEqual([0, 0], labels[:2].tolist())
+        self.assertIn(labels[2:].tolist(), ([1, 1, 2], [2, 1, 1]))
+
+    # Should pass over a donor of one color whose SSE is only against its stale centroid, with or without weights
+    def test_split_single_color_donor(self):
+        k_colors = [(100, 0, 0), (2, 0, 0), (0, 0, 0)]
+        for weights in (None, np.array([2, 1, 1])):
+            with self.subTest(weighted=weights is not None):
+                colors = [(200, 0, 0), (0, 0, 0), (4, 0, 0)]
+                pixels = np.array(colors if weights is not None else colors[:1] + colors, dtype=np.uint8)
+                labels = np.array([0] * (len(pixels) - 2) + [1, 1])
+                self.assertEqual(1, reseed_empty_clusters(pixels, labels, k_colors, weights, method='split'))
+                self.assertEqual([0, 1, 2], sorted(set(labels.tolist())))
+                self.assertEqual(1, np.count_nonzero(labels == 2))
+        # Without any cluster to split, fall back to moving the farthest pixel
+        pixels = np.array([(200, 0, 0), (200, 0, 0)], dtype=np.uint8)
+        labels = np.array([0, 0])
+        self.assertEqual(1, reseed_empty_clusters(pixels, labels, [(100, 0, 0), (0, 0, 0)], method='split'))
+        self.assertEqual([0, 1], sorted(labels.tolist()))
+
+    # Should split again by the SSEs of the halves of earlier splits, not of the clusters before them
+    def test_split_several(self):
+        pixels = np.array([(0, 0, 0), (10, 0, 0), (100, 0, 0), (110, 0, 0), (200, 0, 0), (201, 0, 0)],
+                          dtype=np.uint8)
+        labels = np.array([0, 0, 0, 0, 1, 1])
+        k_colors = [(55, 0, 0), (200, 0, 0), (0, 0, 0), (0, 0, 0)]
+        self.assertEqual(2, reseed_empty_clusters(pixels, labels, k_colors, method='split'))
+        self.assertEqual([1, 1, 2, 2], sorted(np.bincount(labels).tolist()))
+        self.assertEqual(labels[4], labels[5])
+
+    # Should leave clusters empty when every pixel already sits on its centroid
+    def test_too_few_colors(self):
+        pixels = np.array([(0, 0, 0), (50, 50, 50)], dtype=np.uint8)
+        labels = np.array([0, 1])
+        self.assertEqual(0, reseed_empty_clusters(pixels, labels, [(0, 0, 0), (50, 50, 50), (50, 50, 50)]))
+        self.assertEqual([(0, 0, 0), (50, 50, 50), (9, 9, 9)],
+                         update_k_colors_np(pixels, labels, 3, empty_colors=[(0, 0, 0), (0, 0, 0), (9, 9, 9)]))
+
+
+class TestGetMaxShift(TestCase):
+    # Should return the largest distance moved by any centroid, including fractional moves
+    def test_max_shift(self):
+        list_1 = [(0.0, 0.0, 0.0), (10.5, 20.0, 30.0)]
+        list_2 = [(0.0, 3.0, 4.0), (10.0, 20.0, 30.0)]
+        self.assertEqual(5.0, get_max_shift(list_1, list_2))
+
+
+class TestGetRng(TestCase):
+    # Should replay the same draws for the same seed and stream, and independent draws for other streams
+    def test_streams(self):
+        def get_draws(rng):
+            indices = [choose_weighted_index(np.ones(100), rng) for _ in range(3)]
+            return indices + sample_indices(100, 3, rng=rng).tolist()
+        draws = get_draws(get_rng(42, 0, 3))
+        self.assertEqual(draws, get_draws(get_rng(42, 0, 3)))
+        self.assertNotEqual(draws, get_draws(get_rng(42, 1, 3)))
+
+    # Should leave the shared random module alone, so concurrent processes cannot disturb each other's streams
+    def test_random_module_untouched(self):
+        state = random.getstate()
+        get_k_means_plus_plus_centroids(np.arange(30, dtype=np.uint8).reshape(10, 3), 3, rng=get_rng(7, 0, 3))
+        self.assertEqual(state, random.getstate())
@@ -0,0 +1,38 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+from lab_cache_utils import *
+
+
+class TestLabCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "img.jpg")
+        with open(self.file_path, 'wb') as src_file:
+            src_file.write(b'image data')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # Should key cached pixels on the file's contents, mtime and resize level
+    def test_get_lab_cache_path(self):
+        path = get_lab_cache_path(self.file_path, 100, self.tmp_dir.name)
+        self.assertEqual(path, get_lab_cache_path(self.file_path, 100, self.tmp_dir.name))
+        self.assertNotEqual(path, get_lab_cache_path(self.file_path, 50, self.tmp_dir.name))
+        os.utime(self.file_path, ns=(0, 0))
+        self.assertNotEqual(path, get_lab_cache_path(self.file_path, 100, self.tmp_dir.name))
+
+    # Should map saved pixels back with the image size, and miss on missing or unreadable files
+    def test_save_and_load(self):
+        path = get_lab_cache_path(self.file_path, 100, os.path.join(self.tmp_dir.name, "cache"))
+        self.assertIsNone(load_lab_pixels(path))
+        pixels = np.random.default_rng(5).integers(0, 256, size=(6 * 4, 3), dtype=np.uint8)
+        save_lab_pixels(path, pixels, 6, 4)
+        cached_pixels, width, height = load_lab_pixels(path)
+        self.assertIsInstance(cached_pixels, np.memmap)
+        self.assertEqual((6, 4), (width, height))
+        self.assertEqual(pixels.tolist(), cached_pixels.tolist())
+        with open(path, 'wb') as cache_file:
+            cache_file.write(b'partial')
+        self.assertIsNone(load_lab_pixels(path))
@@ -0,0 +1,47 @@
+from unittest import TestCase
+import json
+import numpy as np
+from Palette_Result import Palette_Result
+from palette_utils import get_rgb_colors
+
+
+class TestPaletteResult(TestCase):
+    def setUp(self):
+        labels = np.array([0, 1, 1, 2, 2, 2], dtype=np.uint8)
+        self.result = Palette_Result(3, [(40.4, 130.0, 120.2), (200.0, 120.0, 140.0), (120.0, 100.0, 160.0)],
+                                     np.bincount(labels) / len(labels), 1234.5, labels, 3, 2, 1, 42)
+
+    # Should give the palette as sRGB, hex and CIE Lab with proportions, and leave out the label map
+    def test_to_json(self):
+        palette = json.loads(self.result.to_json())
+        self.assertEqual((3, 1234.5, 2, 42), (palette['k'], palette['SSE'], palette['run'], palette['seed']))
+        rgb_colors = get_rgb_colors([(40, 130, 120), (200, 120, 140), (120, 100, 160)]).tolist()
+        self.assertEqual(rgb_colors, [color['rgb'] for color in palette['colors']])
+        self.assertEqual('#%02x%02x%02x' % tuple(rgb_colors[0]), palette['colors'][0]['hex'])
+        self.assertEqual([round(40 * 100 / 255, 2), 2, -8], palette['colors'][0]['lab'])
+        self.assertAlmostEqual(1.0, sum(color['proportion'] for color in palette['colors']))
+        self.assertNotIn('labels', palette)
+
+    # Should rebuild the rounded palette, proportions, SSE and label map from the binary layout
+    def test_bytes_round_trip(self):
+        data = self.result.to_bytes()
+        rebuilt = Palette_Result.from_bytes(data)
+        self.assertEqual([(40, 130, 120), (200, 120, 140), (120, 100, 160)], rebuilt.k_colors)
+        np.testing.assert_allclose(self.result.proportions, rebuilt.proportions, rtol=1e-6)
+        self.assertEqual((1234.5, 3, 2, 1, 42), (rebuilt.SSE, rebuilt.width, rebuilt.height, rebuilt.run_num,
+                                                 rebuilt.seed))
+        self.assertEqual(self.result.labels.tolist(), rebuilt.labels.tolist())
+        # Without the label map only the header and palette are left
+        self.assertIsNone(Palette_Result.from_bytes(self.result.to_bytes(include_labels=False)).labels)
+        self.assertLess(len(self.result.to_bytes(include_labels=False)), len(data))
+
+    # Should reject data that is not a palette result
+    def test_from_bytes_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            Palette_Result.from_bytes(b'\xff' * 64)
+
+    # Should refuse seeds the binary layout cannot hold rather than fail inside struct
+    def test_to_bytes_rejects_large_seed(self):
+        self.result.seed = 1 << 64
+        with self.assertRaises(ValueError):
+            self.result.to_bytes()
@@ -0,0 +1,71 @@
+from unittest import TestCase
+import io
+import numpy as np
+from PIL import ImageCms
+from palette_utils import *
+
+
+class TestCreateReducedImage(TestCase):
+    # Should match transforming a LAB image, filled pixel by pixel with the palette colors, to sRGB
+    def test_matches_full_transform(self):
+        k_colors = [(40, 130, 120), (200, 120, 140), (120, 100, 160)]
+        labels = np.array([0, 1, 2, 2, 1, 0])
+        expected_img = create_lab_image(np.array(k_colors, dtype=np.uint8)[labels], 3, 2)
+        lab2rgb = ImageCms.buildTransformFromOpenProfiles(ImageCms.createProfile("LAB"),
+                                                          ImageCms.createProfile("sRGB"), "LAB", "RGB")
+        expected_img = ImageCms.applyTransform(expected_img, lab2rgb)
+        actual_img = create_reduced_image("LAB", 3, 2, labels, k_colors)
+        self.assertEqual(expected_img.tobytes(), actual_img.tobytes())
+
+
+class TestPaletteLut(TestCase):
+    # Should only map to palette colors, sending black and white to the darkest and lightest palette colors
+    def test_maps_to_palette(self):
+        k_colors = [(20, 128, 128), (128, 160, 150), (240, 128, 128)]
+        rgb_colors = get_rgb_colors(k_colors)
+        lut = create_palette_lut(k_colors, lut_size=5)
+        self.assertEqual((125, 3), lut.shape)
+        self.assertLessEqual({tuple(color) for color in lut.tolist()}, {tuple(color) for color in rgb_colors.tolist()})
+        self.assertEqual(rgb_colors[0].tolist(), lut[0].tolist())
+        self.assertEqual(rgb_colors[2].tolist(), lut[-1].tolist())
+
+
+class TestCreateAppendedPalette(TestCase):
+    # Should draw a band for every cluster, including clusters of equal size, largest first
+    def test_equal_sized_bands(self):
+        k_colors = [(40, 130, 120), (200, 120, 140), (120, 100, 160)]
+        labels = np.array([0, 1, 1, 2] * 25)
+        src_img = create_lab_image(np.array(k_colors, dtype=np.uint8)[labels], 20, 5)
+        palette_img = create_appended_palette(src_img, "LAB", 20, 5, k_colors, labels)
+        self.assertEqual((20, 80), palette_img.size)
+        band_colors = np.asarray(palette_img)[-1, :, :]
+        rgb_colors = get_rgb_colors(k_colors)
+        self.assertEqual([rgb_colors[1].tolist()] * 10 + [rgb_colors[0].tolist()] * 5 + [rgb_colors[2].tolist()] * 5,
+                         band_colors.tolist())
+
+
+class TestGetResizedImage(TestCase):
+    def setUp(self):
+        img = Image.new("RGB", (400, 200), (10, 200, 30))
+        img.paste((200, 0, 0), (0, 0, 100, 100))
+        # Orientation 6: stored sideways, displayed rotated 90 degrees clockwise
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        self.data = io.BytesIO()
+        img.save(self.data, "JPEG", exif=exif, quality=95)
+
+    # Should decode at reduced scale, then give the upright image at the requested fraction of its dimensions
+    def test_reduced_and_upright(self):
+        with Image.open(self.data) as img:
+            resized = get_resized_image(img, 25)
+            self.assertEqual((100, 50), img.size)
+        self.assertEqual((50, 100), resized.size)
+        # The red block in the stored top left corner ends up in the top right corner
+        red, green, _ = resized.getpixel((40, 5))
+        self.assertGreater(red, 150)
+        self.assertLess(green, 50)
+
+    # Should only rotate when not resizing
+    def test_full_size(self):
+        with Image.open(self.data) as img:
+            self.assertEqual((200, 400), get_resized_image(img, 100).size)
@@ -0,0 +1,19 @@
+from unittest import TestCase
+import numpy as np
+from parallel_utils import share_array, attach_array
+
+
+class TestSharedArrays(TestCase):
+    # Should expose the same values through an attached read-only view of the shared segment
+    def test_share_and_attach(self):
+        array = np.arange(30, dtype=np.uint8).reshape(10, 3)
+        segment, spec = share_array(array)
+        try:
+            attached_segment, attached = attach_array(spec)
+            self.assertEqual(array.tolist(), attached.tolist())
+            self.assertFalse(attached.flags.writeable)
+            del attached
+            attached_segment.close()
+        finally:
+            segment.close()
+            segment.unlink()
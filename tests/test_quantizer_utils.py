@@ -0,0 +1,22 @@
+from unittest import TestCase
+import numpy as np
+from quantizer_utils import *
+
+
+class TestQuantizers(TestCase):
+    # Should find the mean of each of k well-separated groups of colors
+    def test_separated_groups(self):
+        points = np.array([(10, 10, 10), (12, 10, 10), (200, 50, 50), (202, 50, 50), (100, 220, 100)] * 4,
+                          dtype=np.uint8)
+        expected_colors = [(11, 10, 10), (100, 220, 100), (201, 50, 50)]
+        for name, quantizer in QUANTIZERS.items():
+            with self.subTest(name):
+                self.assertEqual(expected_colors, sorted(tuple(round(value) for value in color)
+                                                         for color in quantizer(points, 3)))
+
+    # Should return k colors even when the image has fewer distinct colors than k
+    def test_fewer_colors_than_k(self):
+        points = np.array([(1, 2, 3)] * 5 + [(200, 100, 50)] * 5, dtype=np.uint8)
+        for name, quantizer in QUANTIZERS.items():
+            with self.subTest(name):
+                self.assertEqual(4, len(quantizer(points, 4, np.ones(10))))
@@ -0,0 +1,57 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+from Palette_Result import Palette_Result
+from Result_Cache import Result_Cache
+
+
+class TestResultCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        labels = np.arange(64, dtype=np.uint8) % 2
+        self.result = Palette_Result(2, [(40, 130, 120), (200, 120, 140)], np.bincount(labels) / len(labels), 12.5,
+                                     labels, 8, 8, 0, 42)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # Should key results on both the image bytes and the parameters
+    def test_get_key(self):
+        key = Result_Cache.get_key(b'image', 6, 100, 'k-means', 42)
+        self.assertEqual(key, Result_Cache.get_key(b'image', 6, 100, 'k-means', 42))
+        self.assertNotEqual(key, Result_Cache.get_key(b'other image', 6, 100, 'k-means', 42))
+        self.assertNotEqual(key, Result_Cache.get_key(b'image', 6, 100, 'k-means', None))
+
+    # Should count misses and hits, and give back the stored result and image
+    def test_hit_and_miss(self):
+        cache = Result_Cache(self.cache_dir)
+        self.assertIsNone(cache.get("key"))
+        cache.put("key", self.result)
+        # A result stored without its image does not answer requests for the image
+        self.assertIsNone(cache.get("key", need_image=True))
+        cached = cache.get("key")
+        self.assertEqual((self.result.k_colors, 12.5, 42), (cached.k_colors, cached.SSE, cached.seed))
+        self.assertEqual(self.result.labels.tolist(), cached.labels.tolist())
+
+        self.result.image_path = os.path.join(self.tmp_dir.name, "result.jpeg")
+        with open(self.result.image_path, 'wb') as image_file:
+            image_file.write(b'jpeg data')
+        cache.put("key", self.result)
+        with open(cache.get("key", need_image=True).image_path, 'rb') as image_file:
+            self.assertEqual(b'jpeg data', image_file.read())
+        self.assertEqual((2, 2, 1), tuple(cache.get_stats()[stat] for stat in ('hits', 'misses', 'entries')))
+
+    # Should evict the least recently used entries past the size limit, and pick up entries left on disk
+    def test_lru_eviction(self):
+        entry_bytes = len(self.result.to_bytes())
+        cache = Result_Cache(self.cache_dir, max_bytes=2 * entry_bytes)
+        cache.put("a", self.result)
+        cache.put("b", self.result)
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", self.result)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(2 * entry_bytes, cache.get_stats()['bytes'])
+        reopened = Result_Cache(self.cache_dir, max_bytes=2 * entry_bytes)
+        self.assertEqual(['a', 'c'], sorted(reopened.entries))
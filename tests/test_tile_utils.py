@@ -0,0 +1,69 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+from PIL import Image
+from tile_utils import *
+from k_means_utils import get_labels_np, get_total_SSE, update_k_colors_np
+from k_means_utils import reseed_empty_clusters as reseed_empty_labelled_clusters
+from palette_utils import create_appended_palette, create_lab_image
+
+
+class TestTileStatistics(TestCase):
+    # Should accumulate the same centroids and SSE over tiles as one pass over every pixel
+    def test_matches_full_pass(self):
+        rng = np.random.default_rng(2)
+        pixels = rng.integers(0, 256, size=(1000, 3), dtype=np.uint8)
+        k_colors = [tuple(pixel) for pixel in pixels[:5].tolist()]
+        labels = get_labels_np(pixels, k_colors)
+        counts, sums, total_SSE, _ = get_tile_statistics(pixels, k_colors, 128)
+        np.testing.assert_allclose(update_k_colors_np(pixels, labels, 5), get_tile_means(counts, sums, k_colors))
+        self.assertAlmostEqual(get_total_SSE(k_colors, pixels, labels), total_SSE, delta=1e-6 * total_SSE)
+
+    # Should re-seed empty clusters with the farthest pixels like re-seeding with labels does
+    def test_reseed_matches_labels(self):
+        pixels = np.array([[0, 0, 0], [10, 0, 0], [200, 0, 0], [250, 0, 0], [20, 0, 0]], dtype=np.uint8)
+        # The last two centroids are too far away to be nearest to any pixel
+        k_colors = [(10, 0, 0), (220, 0, 0), (255, 255, 255), (0, 255, 255)]
+        labels = get_labels_np(pixels, k_colors)
+        self.assertEqual(2, reseed_empty_labelled_clusters(pixels, labels, k_colors))
+        counts, sums, _, farthest = get_tile_statistics(pixels, k_colors, 2, num_farthest=4)
+        self.assertEqual(2, reseed_empty_clusters(counts, sums, farthest))
+        # Both moved pixels came from the second cluster, which keeps its color
+        np.testing.assert_allclose(update_k_colors_np(pixels, labels, 4, empty_colors=k_colors),
+                                   get_tile_means(counts, sums, k_colors))
+
+
+class TestTiledImages(TestCase):
+    # Should read raw files without decoding them and convert them the same as decoded images
+    def test_create_lab_tiles(self):
+        rng = np.random.default_rng(3)
+        img = Image.fromarray(rng.integers(0, 256, size=(7, 9, 3), dtype=np.uint8))
+        expected = np.asarray(color_utils.rgb_to_lab_image(img)).reshape(-1, 3) ^ np.array([0, 128, 128], np.uint8)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for extension in (".ppm", ".bmp", ".png"):
+                with self.subTest(extension=extension):
+                    path = os.path.join(tmp_dir, "img" + extension)
+                    img.save(path)
+                    with Image.open(path) as file_img:
+                        self.assertEqual(extension != ".png", get_raw_rgb_rows(file_img) is not None)
+                        pixels, width, height = create_lab_tiles(file_img, 20)
+                    self.assertEqual((9, 7), (width, height))
+                    self.assertEqual(expected.tolist(), np.asarray(pixels).tolist())
+
+    # Should write the same appended palette tile by tile as the in-memory version, in either orientation
+    def test_save_appended_palette(self):
+        rng = np.random.default_rng(4)
+        k_colors = [(40, 130, 120), (200, 120, 140), (120, 100, 160)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for width, height in ((60, 40), (40, 60)):
+                with self.subTest(size=(width, height)):
+                    pixels = rng.integers(0, 256, size=(width * height, 3), dtype=np.uint8)
+                    labels = get_labels_np(pixels, k_colors)
+                    expected = create_appended_palette(create_lab_image(pixels, width, height), "LAB", width,
+                                                       height, k_colors, labels)
+                    path = os.path.join(tmp_dir, f"{width}_{height}.png")
+                    save_appended_palette(path, pixels, width, height, k_colors, np.bincount(labels), 500)
+                    with Image.open(path) as actual:
+                        self.assertEqual(expected.size, actual.size)
+                        self.assertEqual(expected.tobytes(), actual.tobytes())
@@ -0,0 +1,263 @@
+## Name: Eddie Wu
+## Description: Module for tiled, out-of-core k-means: the image lives in a memory-mapped Lab buffer on disk and is
+##              processed in bands of whole rows, so memory use is bounded by the tile size rather than image size
+
+import struct
+import tempfile
+import zlib
+from PIL import ImageOps
+import numpy as np
+import color_utils
+import k_means_utils
+import palette_utils
+
+# Number of pixels drawn across all tiles to seed centroids on
+SEED_SAMPLE_SIZE = 1 << 16
+# zlib level for streamed PNG output
+PNG_COMPRESSION_LEVEL = 6
+
+
+## Maps the pixel rows of an image file that stores them uncompressed (e.g. PPM, uncompressed TIFF or BMP), so
+## they can be read without decoding the whole image
+# @param img - PIL image opened from a file and not yet loaded
+# @return height x width x 3 read-only array of RGB values backed by the file, None if the file is not stored as
+#         raw RGB rows or needs rotating
+#
+def get_raw_rgb_rows(img):
+    # Images already loaded or made in memory have no tiles left to read
+    tiles = getattr(img, 'tile', None)
+    if not tiles or len(tiles) != 1 or not getattr(img, 'filename', None) or img.getexif().get(0x0112, 1) != 1:
+        return None
+    codec_name, extents, offset, args = tiles[0]
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+    if codec_name != 'raw' or tuple(extents) != (0, 0, img.width, img.height) or rawmode not in ('RGB', 'BGR'):
+        return None
+    stride = stride or img.width * 3
+    rows = np.memmap(img.filename, dtype=np.uint8, mode='r', offset=offset, shape=(img.height, stride))
+    rows = rows[:, :img.width * 3].reshape(img.height, img.width, 3)
+    if orientation < 0:
+        # Rows stored bottom up
+        rows = rows[::-1]
+    return rows[:, :, ::-1] if rawmode == 'BGR' else rows
+
+
+## Converts an image to Lab band by band into a memory-mapped buffer in a temporary file, which is deleted once
+## the buffer is no longer used
+## NB images that are not stored as raw RGB rows are decoded whole by PIL first, then released
+# @param img - PIL image opened from a file
+# @param tile_size - approximate number of pixels per band (rounded down to whole rows, at least one row)
+# @return tuple of (N x 3 uint8 memmap of Lab values with pixel (x, y) at index y * width + x, width, height)
+#
+def create_lab_tiles(img, tile_size):
+    rgb_rows = get_raw_rgb_rows(img)
+    if rgb_rows is None:
+        ImageOps.exif_transpose(img, in_place=True)
+    img_width, img_height = img.width, img.height
+    pixels = np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode='w+', shape=(img_width * img_height, 3))
+    tile_rows = get_tile_rows(img_width, tile_size)
+    for y in range(0, img_height, tile_rows):
+        rows = min(tile_rows, img_height - y)
+        if rgb_rows is not None:
+            band = np.ascontiguousarray(rgb_rows[y:y + rows]).reshape(-1, 3)
+        else:
+            band = np.asarray(img.crop((0, y, img_width, y + rows)).convert("RGB")).reshape(-1, 3)
+        color_utils.rgb_to_lab_pixels(band, out=pixels[y * img_width:(y + rows) * img_width])
+    pixels.flush()
+    if rgb_rows is None:
+        img.close()
+    return pixels, img_width, img_height
+
+
+## Returns the number of whole rows that make up a tile
+# @param img_width - width of image
+# @param tile_size - approximate number of pixels per tile
+# @return int number of rows, at least 1
+#
+def get_tile_rows(img_width, tile_size):
+    return max(1, tile_size // img_width)
+
+
+## Splits a pixel buffer into tiles
+# @param num_pixels - number of pixels in the buffer
+# @param tile_size - number of pixels per tile
+# @return iterator of (start, stop) index pairs
+#
+def get_tile_bounds(num_pixels, tile_size):
+    return ((start, min(start + tile_size, num_pixels)) for start in range(0, num_pixels, tile_size))
+
+
+## Draws a uniform sample of pixels, reading them in index order so each tile is read at most once
+# @param pixels - N x 3 array (e.g. memmap) of pixel values
+# @param size - number of pixels to draw, with replacement (int)
+# @param rng - optional numpy.random.Generator to draw from, a fresh one if None
+# @return size x 3 array of pixel values
+#
+def get_tile_sample(pixels, size, rng=None):
+    return np.asarray(pixels[np.sort(k_means_utils.sample_indices(len(pixels), size, rng=rng))])
+
+
+## Labels every pixel tile by tile and accumulates the sufficient statistics of each cluster
+# @param pixels - N x 3 array (e.g. memmap) of pixel values
+# @param k_colors - list of k tuples (centroids)
+# @param tile_size - number of pixels per tile
+# @param num_farthest - number of pixels farthest from their centroid to keep, for re-seeding empty clusters
+# @return tuple of (array of k counts, k x 3 array of channel sums, total SSE, (distances, labels, pixels) of
+#         the num_farthest pixels farthest from their centroid in descending order of distance)
+#
+def get_tile_statistics(pixels, k_colors, tile_size, num_farthest=0):
+    k = len(k_colors)
+    centroids = np.asarray(k_colors, dtype=np.float64)
+    counts = np.zeros(k)
+    sums = np.zeros((k, 3))
+    total_SSE = 0.0
+    farthest = (np.empty(0), np.empty(0, dtype=np.intp), np.empty((0, 3), dtype=np.uint8))
+    for start, stop in get_tile_bounds(len(pixels), tile_size):
+        tile = np.asarray(pixels[start:stop])
+        labels = k_means_utils.get_labels_np(tile, k_colors)
+        diffs = tile - centroids[labels]
+        sq_dists = np.einsum('ij,ij->i', diffs, diffs)
+        counts += np.bincount(labels, minlength=k)
+        sums += np.stack([np.bincount(labels, weights=tile[:, channel], minlength=k) for channel in range(3)],
+                         axis=1)
+        total_SSE += float(sq_dists.sum())
+        if num_farthest > 0:
+            # Merge this tile's farthest pixels with the farthest so far
+            tile_idx = np.argpartition(sq_dists, -min(num_farthest, len(tile)))[-num_farthest:]
+            merged = [np.concatenate([kept, new]) for kept, new in
+                      zip(farthest, (sq_dists[tile_idx], labels[tile_idx].astype(np.intp), tile[tile_idx]))]
+            order = np.argsort(-merged[0], kind='stable')[:num_farthest]
+            farthest = tuple(values[order] for values in merged)
+    return counts, sums, total_SSE, farthest
+
+
+## Gives every empty cluster the pixel farthest from its centroid by moving it between the clusters' statistics,
+## the same as re-seeding 'farthest' does with labels
+# @param counts - array of k counts, updated in place
+# @param sums - k x 3 array of channel sums, updated in place
+# @param farthest - (distances, labels, pixels) of the farthest pixels from get_tile_statistics
+# @return number of empty clusters that were re-seeded (int)
+#
+def reseed_empty_clusters(counts, sums, farthest):
+    num_reseeded = 0
+    for cluster_idx, sq_dist, label, pixel in zip(np.flatnonzero(counts == 0).tolist(), *farthest):
+        if sq_dist <= 0:
+            break
+        counts[label] -= 1
+        sums[label] -= pixel
+        counts[cluster_idx] = 1
+        sums[cluster_idx] = pixel
+        num_reseeded += 1
+    return num_reseeded
+
+
+## Computes centroids from cluster statistics
+# @param counts - array of k counts
+# @param sums - k x 3 array of channel sums
+# @param empty_colors - list of k tuples, an empty cluster keeps its color from here
+# @return list of k tuples of three floats
+#
+def get_tile_means(counts, sums, empty_colors):
+    empty = counts == 0
+    averages = sums / np.where(empty, 1, counts)[:, np.newaxis]
+    averages[empty] = np.asarray(empty_colors, dtype=np.float64)[empty]
+    return [tuple(color) for color in averages.tolist()]
+
+
+## Writes a PNG chunk
+# @param file - file object open for binary writing
+# @param chunk_type - 4-byte chunk type
+# @param data - chunk data (bytes)
+#
+def write_png_chunk(file, chunk_type, data):
+    file.write(struct.pack('>I', len(data)) + chunk_type + data)
+    file.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+## Writes an RGB PNG from bands of rows as they are produced, so the whole image is never held in memory
+# @param path - path to save the image to
+# @param width - width of image
+# @param height - height of image, the sum of the bands' row counts
+# @param bands - iterator of rows x width x 3 uint8 arrays of RGB values, top to bottom
+#
+def save_png_rows(path, width, height, bands):
+    compressor = zlib.compressobj(PNG_COMPRESSION_LEVEL)
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per channel, truecolor, default compression, filter and interlace methods
+        write_png_chunk(file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        for band in bands:
+            # Every row starts with its filter type, 0 for none
+            filtered = np.zeros((len(band), width * 3 + 1), dtype=np.uint8)
+            filtered[:, 1:] = band.reshape(len(band), -1)
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                write_png_chunk(file, b'IDAT', data)
+        write_png_chunk(file, b'IDAT', compressor.flush())
+        write_png_chunk(file, b'IEND', b'')
+
+
+## Saves the image with every pixel replaced by the palette color of its nearest centroid, tile by tile
+# @param path - path to save the PNG to
+# @param pixels - N x 3 array (e.g. memmap) of Lab pixel values
+# @param img_width - width of image
+# @param img_height - height of image
+# @param k_colors - list of k tuples (centroids) to label pixels with
+# @param palette_colors - list of k Lab tuples of ints to color pixels with
+# @param tile_size - approximate number of pixels per tile
+#
+def save_reduced_image(path, pixels, img_width, img_height, k_colors, palette_colors, tile_size):
+    rgb_colors = palette_utils.get_rgb_colors(palette_colors)
+    tile_rows = get_tile_rows(img_width, tile_size)
+    bands = (rgb_colors[k_means_utils.get_labels_np(np.asarray(pixels[y * img_width:(y + tile_rows) * img_width]),
+                                                    k_colors)].reshape(-1, img_width, 3)
+             for y in range(0, img_height, tile_rows))
+    save_png_rows(path, img_width, img_height, bands)
+
+
+## Produces the rows of an image with proportional palette bands appended, laid out like
+## palette_utils.create_appended_palette, band by band
+# @param pixels - N x 3 array (e.g. memmap) of Lab pixel values
+# @param img_width - width of image
+# @param img_height - height of image
+# @param palette_colors - list of k Lab tuples of ints
+# @param cluster_sizes - array of k cluster sizes
+# @param tile_size - approximate number of pixels per band
+# @return iterator of rows x canvas width x 3 uint8 arrays of RGB values, top to bottom
+#
+def get_appended_palette_bands(pixels, img_width, img_height, palette_colors, cluster_sizes, tile_size):
+    canvas_width, canvas_height, orientation, section_start = palette_utils.get_palette_layout(img_width,
+                                                                                              img_height)
+    band_colors = palette_utils.get_band_colors(palette_colors, np.asarray(cluster_sizes),
+                                                max(img_width, img_height))
+    tile_rows = get_tile_rows(canvas_width, tile_size)
+    for y in range(0, canvas_height, tile_rows):
+        rows = min(tile_rows, canvas_height - y)
+        # Start from white, (255, 128, 128) in PIL LAB
+        band = np.empty((rows, canvas_width, 3), dtype=np.uint8)
+        band[...] = (255, 128, 128)
+        # Rows of the original image in this band
+        img_rows = max(0, min(rows, img_height - y))
+        band[:img_rows, :img_width] = pixels[y * img_width:(y + img_rows) * img_width].reshape(-1, img_width, 3)
+        if orientation == 'P':
+            band[:, section_start:] = band_colors[y:y + rows, np.newaxis, :]
+        else:
+            band[max(0, section_start - y):] = band_colors[np.newaxis, :, :]
+        yield color_utils.lab_to_rgb_pixels(band.reshape(-1, 3)).reshape(band.shape)
+
+
+## Saves the image with proportional palette bands appended, tile by tile
+# @param path - path to save the PNG to
+# @param pixels - N x 3 array (e.g. memmap) of Lab pixel values
+# @param img_width - width of image
+# @param img_height - height of image
+# @param palette_colors - list of k Lab tuples of ints
+# @param cluster_sizes - array of k cluster sizes
+# @param tile_size - approximate number of pixels per tile
+#
+def save_appended_palette(path, pixels, img_width, img_height, palette_colors, cluster_sizes, tile_size):
+    canvas_width, canvas_height, _, _ = palette_utils.get_palette_layout(img_width, img_height)
+    save_png_rows(path, canvas_width, canvas_height,
+                  get_appended_palette_bands(pixels, img_width, img_height, palette_colors, cluster_sizes,
+                                             tile_size))